@@ -0,0 +1,148 @@
+import argparse
+import http.server
+import json
+import random
+import threading
+import time
+import uuid
+
+SESSION_HEADER = 'X-Transmission-Session-Id'
+DEFAULT_TORRENTS = 1000
+DEFAULT_FILES_PER_TORRENT = 10
+#############################################################################################################
+def make_torrents(count=DEFAULT_TORRENTS, files_per_torrent=DEFAULT_FILES_PER_TORRENT, download_dir='/downloads',
+                  referenced=None, seed=0):
+    # Torrent field dicts, as Transmission would return them. Names in 'referenced' are placed first,
+    # pointing at real items, so the archiver treats those as active
+    rng = random.Random(seed)
+    torrents = []
+    names = list(referenced or [])
+    names += [f'Fake.Torrent.{i:06d}.1080p' for i in range(max(0, count - len(names)))]
+    for torrent_id, name in enumerate(names, start=1):
+        files = [{'name': f'{name}/part{f:04d}.mkv', 'length': 1024 * 1024, 'bytesCompleted': 1024 * 1024}
+                 for f in range(files_per_torrent)]
+        torrents.append({
+            'id': torrent_id,
+            'name': name,
+            'hashString': f'{rng.getrandbits(160):040x}',
+            'percentDone': 1.0,
+            'status': 6,
+            'downloadDir': download_dir,
+            'files': files,
+            'rateDownload': 0,
+            'rateUpload': 0,
+            'activityDate': int(time.time())
+        })
+    return torrents
+#############################################################################################################
+
+
+#############################################################################################################
+class FakeTransmissionHandler(http.server.BaseHTTPRequestHandler):
+    # Minimal Transmission RPC: session handshake, session-get, session-stats and torrent-get
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        server = self.server
+        if self.headers.get(SESSION_HEADER) != server.session_id:
+            self.send_response(409)
+            self.send_header(SESSION_HEADER, server.session_id)
+            self.end_headers()
+            return
+
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        method = request.get('method')
+        arguments = request.get('arguments') or {}
+        server.request_log.append(method)
+
+        if method == 'session-get':
+            result = {
+                'rpc-version': 17,
+                'rpc-version-minimum': 14,
+                'rpc-version-semver': '5.3.0',
+                'version': '4.0.5 (fake)',
+                'download-dir': server.download_dir
+            }
+        elif method == 'session-stats':
+            result = {
+                'activeTorrentCount': len(server.torrents),
+                'pausedTorrentCount': 0,
+                'torrentCount': len(server.torrents),
+                'downloadSpeed': server.download_speed,
+                'uploadSpeed': server.upload_speed,
+                'cumulative-stats': {},
+                'current-stats': {}
+            }
+        elif method == 'torrent-get':
+            result = self.torrent_get(arguments)
+        else:
+            self.reply({'result': f'method {method!r} not supported', 'arguments': {}, 'tag': request.get('tag')})
+            return
+        self.reply({'result': 'success', 'arguments': result, 'tag': request.get('tag')})
+
+    def torrent_get(self, arguments):
+        fields = arguments.get('fields') or list(self.server.torrents[0].keys() if self.server.torrents else [])
+        ids = arguments.get('ids')
+        torrents = self.server.torrents
+        result = {}
+        if ids == 'recently-active':
+            torrents = torrents[:self.server.recently_active]
+            result['removed'] = []
+        elif ids is not None:
+            ids = ids if isinstance(ids, list) else [ids]
+            wanted = {str(i) for i in ids}
+            torrents = [t for t in torrents if str(t['id']) in wanted or t['hashString'] in wanted]
+        result['torrents'] = [{f: t[f] for f in fields if f in t} for t in torrents]
+        return result
+
+    def reply(self, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+#############################################################################################################
+
+
+#############################################################################################################
+def start_fake_transmission(torrents, port=0, download_dir='/downloads', recently_active=10):
+    # Serve on loopback in a background thread. Returns the server; its port is server.server_address[1]
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', port), FakeTransmissionHandler)
+    server.session_id = uuid.uuid4().hex
+    server.torrents = torrents
+    server.download_dir = download_dir
+    server.recently_active = recently_active
+    server.download_speed = 0
+    server.upload_speed = 0
+    server.request_log = []
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+#############################################################################################################
+
+
+#############################################################################################################
+def main():
+    parser = argparse.ArgumentParser(description='Serve a fake Transmission RPC endpoint on loopback')
+    parser.add_argument('--port', type=int, default=9091)
+    parser.add_argument('--torrents', type=int, default=DEFAULT_TORRENTS)
+    parser.add_argument('--files-per-torrent', type=int, default=DEFAULT_FILES_PER_TORRENT)
+    parser.add_argument('--download-dir', default='/downloads')
+    args = parser.parse_args()
+
+    server = start_fake_transmission(make_torrents(args.torrents, args.files_per_torrent, args.download_dir),
+                                     args.port, args.download_dir)
+    print(f'Fake Transmission RPC with {args.torrents} torrents on 127.0.0.1:{server.server_address[1]}')
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+#############################################################################################################
+
+
+#############################################################################################################
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,242 @@
+import argparse
+import contextlib
+import datetime as dt
+import importlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.fake_transmission import make_torrents, start_fake_transmission
+from bench.synthetic_trees import (DEFAULT_ARCHIVED_RATIO, DEFAULT_FILE_SIZE, DEFAULT_FILES_PER_DIR, DEFAULT_ITEMS,
+                                   DEFAULT_RAR_RATIO, generate_trees)
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(REPO_DIR, 'bench', 'results')
+DEFAULT_TORRENTS = 1000
+DEFAULT_REPEATS = 3
+DEFAULT_MOVE_SAMPLE = 5
+#############################################################################################################
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR,
+                              check=True, capture_output=True, text=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+#############################################################################################################
+
+
+#############################################################################################################
+def timed(func, *args, **kwargs):
+    start = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - start, result
+#############################################################################################################
+
+
+#############################################################################################################
+def reset_main_state(main):
+    # Fresh caches and counters for every repetition, so runs are comparable
+    if main._CACHE_DB is not None:
+        main._CACHE_DB.close()
+        main._CACHE_DB = None
+    shutil.rmtree(main.CACHE_DIR, ignore_errors=True)
+    main._TRANSMISSION_CLIENTS.clear()
+    main.STAGE_RECORDS.clear()
+    main.SIZE_CACHE_STATS.update(hits=0, misses=0)
+#############################################################################################################
+
+
+#############################################################################################################
+def prepare_run(args, work_dir, repeat):
+    # New trees and a new fake Transmission server. Roughly half the items are still "seeding"
+    shutil.rmtree(work_dir, ignore_errors=True)
+    archive_root = os.path.join(args.archive_root, f'bench_archive_{os.getpid()}') if args.archive_root else None
+    if archive_root:
+        shutil.rmtree(archive_root, ignore_errors=True)
+    layout = generate_trees(work_dir, args.items, args.files_per_dir, args.file_size, not args.dense,
+                            args.rar_ratio, args.archived_ratio, seed=repeat, archive_root=archive_root)
+    seeding = [item['name'] for item in layout['items'][::2]]
+    torrents = make_torrents(args.torrents, args.files_per_dir, layout['source_dir'], seeding, seed=repeat)
+    server = start_fake_transmission(torrents, download_dir=layout['source_dir'])
+    os.environ['TORBASE'] = work_dir
+    os.environ['TORARCHIVE'] = archive_root or work_dir
+    os.environ['TRANSMISSION_HOST'] = '127.0.0.1'
+    os.environ['TRANSMISSION_PORT'] = str(server.server_address[1])
+    return layout, server
+#############################################################################################################
+
+
+#############################################################################################################
+def run_stage_benchmarks(main, args, work_dir, repeat):
+    timings = {}
+    layout, server = prepare_run(args, work_dir, repeat)
+    try:
+        reset_main_state(main)
+        main.load_environment()
+        quiet = io.StringIO()
+        with contextlib.redirect_stdout(quiet):
+            timings['get_active_transmission_objects'], _ = timed(main.get_active_transmission_objects, False)
+            timings['get_fs_objects'], objects = timed(main.get_fs_objects, layout['source_dir'])
+            timings['classify_entries'], _ = timed(lambda: list(main.classify_entries(layout['source_dir'], objects)))
+
+            archived = [e.path for e in os.scandir(layout['archive_dir']) if e.is_dir(follow_symlinks=False)]
+            start = time.perf_counter()
+            for path in archived:
+                main.get_directory_size(path)
+            timings['get_directory_size'] = time.perf_counter() - start
+
+            move_dest = os.path.join(os.environ['TORARCHIVE'], 'bench_moves')
+            os.makedirs(move_dest, exist_ok=True)
+            sample = [os.path.join(layout['source_dir'], item['name']) for item in layout['items']
+                      if item['type'] != 'symlink'][:args.move_sample]
+            start = time.perf_counter()
+            for path in sample:
+                main.process_object(path, move_dest)
+            timings['process_object'] = time.perf_counter() - start
+    finally:
+        server.shutdown()
+        server.server_close()
+    return timings
+#############################################################################################################
+
+
+#############################################################################################################
+def run_main_benchmark(main, args, work_dir, repeat):
+    # End to end run of main(), plus the stage timings main records itself
+    layout, server = prepare_run(args, work_dir, repeat)
+    try:
+        reset_main_state(main)
+        main_args = main.parse_args(['--no-run-log', '--workers', str(args.workers)])
+        quiet = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(quiet):
+            try:
+                main.main(main_args)
+            except SystemExit:
+                pass
+        total = time.perf_counter() - start
+
+        stages = {}
+        for record in main.STAGE_RECORDS:
+            stages[record['stage']] = stages.get(record['stage'], 0.0) + record['seconds']
+        return total, stages
+    finally:
+        server.shutdown()
+        server.server_close()
+#############################################################################################################
+
+
+#############################################################################################################
+def summarize(samples):
+    return {
+        'runs': samples,
+        'min': min(samples),
+        'median': statistics.median(samples),
+        'mean': statistics.fmean(samples)
+    }
+#############################################################################################################
+
+
+#############################################################################################################
+def print_comparison(results, baseline_path):
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    print(f"{'Stage':<36}{'Baseline':>12}{'Current':>12}{'Change':>10}")
+    for section in ('stages', 'main_stages'):
+        for stage, current in results[section].items():
+            previous = baseline.get(section, {}).get(stage)
+            if not previous:
+                continue
+            change = (current['median'] / previous['median'] - 1) * 100 if previous['median'] else 0.0
+            print(f"{stage:<36}{previous['median']:>12.4f}{current['median']:>12.4f}{change:>+9.1f}%")
+#############################################################################################################
+
+
+#############################################################################################################
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the archiver against synthetic trees and a fake Transmission')
+    parser.add_argument('--items', type=int, default=DEFAULT_ITEMS)
+    parser.add_argument('--files-per-dir', type=int, default=DEFAULT_FILES_PER_DIR)
+    parser.add_argument('--file-size', type=int, default=DEFAULT_FILE_SIZE)
+    parser.add_argument('--dense', action='store_true', help='Write real data instead of sparse files')
+    parser.add_argument('--rar-ratio', type=float, default=DEFAULT_RAR_RATIO)
+    parser.add_argument('--archived-ratio', type=float, default=DEFAULT_ARCHIVED_RATIO)
+    parser.add_argument('--torrents', type=int, default=DEFAULT_TORRENTS)
+    parser.add_argument('--repeats', type=int, default=DEFAULT_REPEATS)
+    parser.add_argument('--move-sample', type=int, default=DEFAULT_MOVE_SAMPLE,
+                        help='Number of objects moved in the process_object benchmark')
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--work-dir', help='Where to build the source tree (default: a temporary directory)')
+    parser.add_argument('--archive-root', help='Put the archive on another device, to benchmark cross-device moves')
+    parser.add_argument('--output', help='Results file (default: bench/results/<timestamp>.json)')
+    parser.add_argument('--compare', metavar='BASELINE', help='Print the change against an earlier results file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as tmp:
+        # Cache, state and config dirs are computed when main is imported, so point them at the sandbox first.
+        # The XDG variables are ignored on macOS, hence the explicit cache and log dirs
+        for var in ('XDG_CACHE_HOME', 'XDG_STATE_HOME', 'XDG_CONFIG_HOME'):
+            os.environ[var] = os.path.join(tmp, var.lower())
+        os.environ['ARCHIVE_CACHE_DIR'] = os.path.join(tmp, 'cache')
+        os.environ['ARCHIVE_LOG_DIR'] = os.path.join(tmp, 'logs')
+        sys.path.insert(0, REPO_DIR)
+        main_module = importlib.import_module('main')
+        # reset_main_state deletes CACHE_DIR, which must never be the real cache
+        for path in (main_module.CACHE_DIR, main_module.LOG_DIR):
+            if os.path.commonpath([os.path.abspath(path), os.path.abspath(tmp)]) != os.path.abspath(tmp):
+                sys.exit(f'Refusing to run: {path} is outside the benchmark sandbox {tmp}')
+        work_dir = os.path.join(tmp, 'tree')
+
+        stage_samples = {}
+        main_samples = []
+        main_stage_samples = {}
+        for repeat in range(args.repeats):
+            for stage, seconds in run_stage_benchmarks(main_module, args, work_dir, repeat).items():
+                stage_samples.setdefault(stage, []).append(seconds)
+            total, stages = run_main_benchmark(main_module, args, work_dir, repeat)
+            main_samples.append(total)
+            for stage, seconds in stages.items():
+                main_stage_samples.setdefault(stage, []).append(seconds)
+            print(f'Repeat {repeat + 1}/{args.repeats}: main() {total:.3f}s')
+
+    results = {
+        'meta': {
+            'date': dt.datetime.now().isoformat(timespec='seconds'),
+            'version': main_module.VERSION,
+            'git': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'params': {k: v for k, v in vars(args).items() if k not in ('output', 'compare')}
+        },
+        'main': summarize(main_samples),
+        'stages': {stage: summarize(samples) for stage, samples in stage_samples.items()},
+        'main_stages': {stage: summarize(samples) for stage, samples in main_stage_samples.items()}
+    }
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{dt.datetime.now().strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print(f"{'Stage':<36}{'Median (s)':>12}{'Min (s)':>12}")
+    print(f"{'main()':<36}{results['main']['median']:>12.4f}{results['main']['min']:>12.4f}")
+    for section in ('stages', 'main_stages'):
+        for stage, summary in results[section].items():
+            label = stage if section == 'stages' else f'main: {stage}'
+            print(f"{label:<36}{summary['median']:>12.4f}{summary['min']:>12.4f}")
+    print(f'Results saved to {output}')
+    if args.compare:
+        print_comparison(results, args.compare)
+#############################################################################################################
+
+
+#############################################################################################################
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+import argparse
+import os
+import random
+import struct
+import zlib
+
+# Sizes are in bytes. Sparse files cost no disk space, so large scales are cheap to generate
+DEFAULT_ITEMS = 50
+DEFAULT_FILES_PER_DIR = 20
+DEFAULT_FILE_SIZE = 4 * 1024 * 1024
+DEFAULT_RAR_RATIO = 0.2
+DEFAULT_ARCHIVED_RATIO = 0.3
+#############################################################################################################
+def _vint(n):
+    out = bytearray()
+    while True:
+        byte = n & 0x7f
+        n >>= 7
+        if n:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+#############################################################################################################
+
+
+#############################################################################################################
+def _rar4_block(head_type, head_flags, body):
+    header = struct.pack('<BHH', head_type, head_flags, 7 + len(body)) + body
+    return struct.pack('<H', zlib.crc32(header) & 0xffff) + header
+#############################################################################################################
+
+
+#############################################################################################################
+def _rar5_block(head_type, head_flags, fields, data_size=None):
+    body = _vint(head_type) + _vint(head_flags) + (_vint(data_size) if data_size is not None else b'') + fields
+    header = _vint(len(body)) + body
+    return struct.pack('<I', zlib.crc32(header)) + header
+#############################################################################################################
+
+
+#############################################################################################################
+def write_fake_rar(base_path, name, data, volumes=1, rar5=True):
+    # Stored (uncompressed) RAR set holding one file, split evenly across volumes. Returns the volume paths
+    chunk = max(1, -(-len(data) // volumes))
+    volume_paths = []
+    for v in range(volumes):
+        part = data[v * chunk:(v + 1) * chunk]
+        last = v == volumes - 1
+        crc = zlib.crc32(data) if last else zlib.crc32(part)
+        name_bytes = name.encode('utf-8')
+        if rar5:
+            out = bytearray(b'Rar!\x1a\x07\x01\x00')
+            out += _rar5_block(1, 0, _vint(0x0001 if volumes > 1 else 0))
+            head_flags = 0x0002 | (0x0008 if v else 0) | (0 if last else 0x0010)
+            fields = (_vint(0x0004) + _vint(len(data)) + _vint(0x20) + struct.pack('<I', crc)
+                      + _vint(0) + _vint(1) + _vint(len(name_bytes)) + name_bytes)
+            out += _rar5_block(2, head_flags, fields, len(part)) + part
+            out += _rar5_block(5, 0, _vint(0 if last else 1))
+        else:
+            out = bytearray(b'Rar!\x1a\x07\x00')
+            out += _rar4_block(0x73, (0x0001 if volumes > 1 else 0) | 0x0010, b'\0' * 6)
+            head_flags = 0x8000 | (0x01 if v else 0) | (0 if last else 0x02)
+            body = struct.pack('<IIBIIBBHI', len(part), len(data), 3, crc, 0, 29, 0x30, len(name_bytes), 0x20)
+            out += _rar4_block(0x74, head_flags, body + name_bytes) + part
+            out += _rar4_block(0x7b, 0x4000, b'')
+
+        suffix = '.rar' if volumes == 1 else f'.part{v + 1:02d}.rar'
+        volume_path = f'{base_path}{suffix}'
+        with open(volume_path, 'wb') as f:
+            f.write(out)
+        volume_paths.append(volume_path)
+    return volume_paths
+#############################################################################################################
+
+
+#############################################################################################################
+def write_file(path, size, sparse=True, rng=None):
+    with open(path, 'wb') as f:
+        if sparse:
+            f.truncate(size)
+        else:
+            remaining = size
+            while remaining:
+                block = min(remaining, 1024 * 1024)
+                f.write(rng.randbytes(block) if rng else os.urandom(block))
+                remaining -= block
+#############################################################################################################
+
+
+#############################################################################################################
+def generate_trees(root, items=DEFAULT_ITEMS, files_per_dir=DEFAULT_FILES_PER_DIR, file_size=DEFAULT_FILE_SIZE,
+                   sparse=True, rar_ratio=DEFAULT_RAR_RATIO, archived_ratio=DEFAULT_ARCHIVED_RATIO, seed=0,
+                   archive_root=None):
+    # Build <root>/zzzNew plus <archive_root>/Media_Archive and Graveyard. Returns a description of the layout
+    rng = random.Random(seed)
+    source_dir = os.path.join(root, 'zzzNew')
+    archive_root = archive_root or root
+    archive_dir = os.path.join(archive_root, 'Media_Archive')
+    os.makedirs(source_dir, exist_ok=True)
+    os.makedirs(archive_dir, exist_ok=True)
+    os.makedirs(os.path.join(archive_root, 'Graveyard'), exist_ok=True)
+
+    layout = {'source_dir': source_dir, 'archive_dir': archive_dir, 'items': [], 'bytes': 0}
+    for i in range(items):
+        name = f'Synthetic.Item.{i:05d}.2160p.WEB-DL'
+        kind = rng.choice(['directory', 'directory', 'directory', 'file', 'symlink'])
+        item_path = os.path.join(source_dir, name)
+
+        if kind == 'file':
+            name += '.iso'
+            item_path += '.iso'
+            write_file(item_path, file_size, sparse, rng)
+            layout['bytes'] += file_size
+        elif kind == 'symlink':
+            os.symlink(os.path.join(source_dir, 'missing-target'), item_path)
+        else:
+            os.makedirs(item_path)
+            for f in range(files_per_dir):
+                write_file(os.path.join(item_path, f'part{f:04d}.mkv'), file_size, sparse, rng)
+            layout['bytes'] += file_size * files_per_dir
+            if rng.random() < rar_ratio:
+                # Small payload, so generating the RAR set stays cheap. The unpacked copy is left next to it
+                payload = rng.randbytes(64 * 1024)
+                write_fake_rar(os.path.join(item_path, name), f'{name}.mkv', payload,
+                               volumes=rng.choice([1, 3]), rar5=rng.random() < 0.5)
+                with open(os.path.join(item_path, f'{name}.mkv'), 'wb') as f:
+                    f.write(payload)
+
+        if kind != 'symlink' and rng.random() < archived_ratio:
+            # Existing (smaller) copy in the archive, to exercise the compare path
+            archived_path = os.path.join(archive_dir, name)
+            if kind == 'file':
+                write_file(archived_path, file_size // 2, sparse, rng)
+            else:
+                os.makedirs(archived_path)
+                for f in range(max(1, files_per_dir // 2)):
+                    write_file(os.path.join(archived_path, f'part{f:04d}.mkv'), file_size, sparse, rng)
+
+        layout['items'].append({'name': name, 'type': kind})
+    return layout
+#############################################################################################################
+
+
+#############################################################################################################
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic source and archive trees')
+    parser.add_argument('root')
+    parser.add_argument('--archive-root', help='Put Media_Archive/Graveyard here (e.g. on another device)')
+    parser.add_argument('--items', type=int, default=DEFAULT_ITEMS)
+    parser.add_argument('--files-per-dir', type=int, default=DEFAULT_FILES_PER_DIR)
+    parser.add_argument('--file-size', type=int, default=DEFAULT_FILE_SIZE)
+    parser.add_argument('--dense', action='store_true', help='Write real data instead of sparse files')
+    parser.add_argument('--rar-ratio', type=float, default=DEFAULT_RAR_RATIO)
+    parser.add_argument('--archived-ratio', type=float, default=DEFAULT_ARCHIVED_RATIO)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    layout = generate_trees(args.root, args.items, args.files_per_dir, args.file_size, not args.dense,
+                            args.rar_ratio, args.archived_ratio, args.seed, args.archive_root)
+    print(f"Generated {len(layout['items'])} items ({layout['bytes']} bytes) in {layout['source_dir']}")
+#############################################################################################################
+
+
+#############################################################################################################
+if __name__ == "__main__":
+    main()
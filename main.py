@@ -1,28 +1,152 @@
+import time
+STARTUP_CLOCK = time.perf_counter()
+import argparse
+import atexit
+import contextlib
 import datetime as dt
+import errno
+import fcntl
+import hashlib
+import importlib.util
+import itertools
+import json
+import mmap
 import os
 import sys
 import subprocess
+import tempfile
 import re
 import pathlib
+import select
 import shutil
+import signal
+import stat
+import struct
+import sqlite3
+import threading
+import zlib
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from types import NoneType
-import humanize as hm
-import transmission_rpc as t_rpc
-import time
+
+
+#############################################################################################################
+def lazy_import(name):
+    # Module object that is only really imported on first attribute access
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f'No module named {name!r}', name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
+#############################################################################################################
+
+
+hm = lazy_import('humanize')
+t_rpc = lazy_import('transmission_rpc')
 
 # Version tag
 VERSION = 1.0
 #############################################################################################################
-def load_shell_environment(profile_path="/Users/scott/.bash_profile"):
+def load_shell_environment(profile_path, keys):
     # Use subprocess to source the shell profile and print the environment variables
     command = f"source {profile_path} && env"
     proc = subprocess.Popen(command, stdout=subprocess.PIPE, shell=True, executable="/usr/local/bin/bash")
+    values = {}
     for line in proc.stdout:
         (key, _, value) = line.decode("utf-8").partition("=")
-        os.environ[key] = value.strip()
+        if key in keys:
+            values[key] = value.strip()
+    proc.wait()
+    return values
+#############################################################################################################
+
+
+#############################################################################################################
+def read_config_file(config_path, keys):
+    # KEY=VALUE lines, as in a shell profile ('export' and quotes are allowed)
+    values = {}
+    try:
+        with open(config_path) as f:
+            for line in f:
+                line = line.strip()
+                if line.startswith('export '):
+                    line = line[len('export '):].strip()
+                key, sep, value = line.partition('=')
+                if sep and key.strip() in keys:
+                    values[key.strip()] = os.path.expandvars(os.path.expanduser(value.strip().strip('"\'')))
+    except OSError:
+        pass
+    return values
+#############################################################################################################
+
+
+#############################################################################################################
+def load_environment(profile_path=None):
+    # Resolve TORBASE/TORARCHIVE from the fastest available source. Returns the name of the source used
+    profile_path = profile_path or PROFILE_PATH
+    if all(os.getenv(k) for k in REQUIRED_ENV_KEYS):
+        source = 'environment'
+    else:
+        values = read_config_file(CONFIG_PATH, ENV_KEYS)
+        source = 'config'
+        if not all(values.get(k) or os.getenv(k) for k in REQUIRED_ENV_KEYS):
+            # Last resort is sourcing the profile, whose result is cached until the profile changes
+            cache_path = os.path.join(CACHE_DIR, 'environment.json')
+            try:
+                profile_mtime = os.stat(profile_path).st_mtime_ns
+            except OSError:
+                profile_mtime = None
+            try:
+                with open(cache_path) as f:
+                    cached = json.load(f)
+            except (OSError, ValueError):
+                cached = {}
+
+            if profile_mtime is not None and cached.get('profile_mtime_ns') == profile_mtime:
+                values = cached['values']
+                source = 'cache'
+            else:
+                values = load_shell_environment(profile_path, ENV_KEYS)
+                source = 'profile'
+                if profile_mtime is not None:
+                    os.makedirs(CACHE_DIR, exist_ok=True)
+                    with open(cache_path, 'w') as f:
+                        json.dump({'profile_mtime_ns': profile_mtime, 'values': values}, f)
+
+        for key, value in values.items():
+            os.environ.setdefault(key, value)
+
+    global SOURCE_VOLUME, ARCHIVE_VOLUME, TRANSMISSION_HOST, TRANSMISSION_PORT
+    SOURCE_VOLUME = os.getenv('TORBASE')
+    ARCHIVE_VOLUME = os.getenv('TORARCHIVE')
+    TRANSMISSION_HOST = os.getenv('TRANSMISSION_HOST', TRANSMISSION_HOST)
+    TRANSMISSION_PORT = int(os.getenv('TRANSMISSION_PORT', TRANSMISSION_PORT))
+    return source
+#############################################################################################################
+
+
+#############################################################################################################
+def mark_startup(label):
+    # Record the time spent in a startup phase, since the previous mark
+    now = time.perf_counter()
+    previous = STARTUP_TIMINGS[-1][2] if STARTUP_TIMINGS else STARTUP_CLOCK
+    STARTUP_TIMINGS.append((label, now - previous, now))
+#############################################################################################################
+
+
+#############################################################################################################
+def print_startup_profile():
+    print_string('{:<28}{:<60}'.format('Startup profile:', ''))
+    for label, seconds, _ in STARTUP_TIMINGS:
+        print_string('{:4}{:<32}{:<60}'.format('', f'{label}:', f'{seconds * 1000:.1f} ms'))
+    print_string('{:4}{:<32}{:<60}'.format('', 'Before first stage:',
+                                            f'{(time.perf_counter() - STARTUP_CLOCK) * 1000:.1f} ms '
+                                            f'(process CPU {time.process_time() * 1000:.1f} ms)'))
 #############################################################################################################
 
-load_shell_environment()
 
 # Global variables
 START_TIME = dt.datetime.now()
@@ -35,10 +159,185 @@ GT_CHAR = '>'
 LT_CHAR = '<'
 TODAY_DATESTAMP = dt.datetime.now().strftime("%Y-%m-%d")
 
+# Concurrency defaults. A single worker keeps the original sequential behaviour
+DEFAULT_WORKERS = 1
+DEFAULT_DEVICE_CONCURRENCY = 1
+DEVICE_CONCURRENCY = DEFAULT_DEVICE_CONCURRENCY
+
+# Copy engine settings. Kernel copies move data in large chunks; the buffered fallback uses a page-aligned buffer
+DEFAULT_COPY_ENGINE = 'auto'
+COPY_ENGINE = DEFAULT_COPY_ENGINE
+KERNEL_COPY_CHUNK = 64 * 1024 * 1024
+BUFFERED_COPY_SIZE = 8 * 1024 * 1024
+_COPY_FALLBACK_ERRNOS = {errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP, errno.EBADF,
+                         errno.ENOTSOCK}
+
+# Failed objects are retried after an exponential backoff: base, 2x base, 4x base... up to the maximum
+FAILURE_BACKOFF_BASE = 300
+FAILURE_BACKOFF_MAX = 24 * 60 * 60
+
+# Cross-device moves copy into a hidden staging name, which is renamed once the copy is complete
+STAGING_SUFFIX = '.partial'
+
+# Copy bandwidth throttling. One token bucket is shared by all copies; rates are in bytes per second.
+# Throttled copies move smaller chunks, so the bucket is consulted often enough to keep the rate smooth
+THROTTLED_COPY_CHUNK = 4 * 1024 * 1024
+THROTTLE_CHECK_INTERVAL = 10
+DEFAULT_TRANSMISSION_BUSY_MBPS = 1
+_THROTTLE = {
+    'enabled': False,
+    'limit': None,
+    'profile': [],
+    'adaptive': None,
+    'busy_threshold': DEFAULT_TRANSMISSION_BUSY_MBPS * 1000 * 1000,
+    'busy': False,
+    'rate': None,
+    'tokens': 0.0,
+    'stamp': 0.0,
+    'next_check': 0.0,
+    'lock': threading.Lock()
+}
+
+# Tree size scanning. Symlinks are skipped by default; 'follow' counts their targets, visiting each directory once
+TREE_SCAN_THREADS = 4
+SYMLINK_POLICY = 'skip'
+
+# Persistent cache of archive-side directory sizes
+SIZE_CACHE_ENABLED = True
+SIZE_CACHE_STATS = {'hits': 0, 'misses': 0}
+_CACHE_DB = None
+_CACHE_DB_LOCK = threading.RLock()
+
+# Content fingerprints: size plus sampled head/middle/tail blocks, escalating to a full hash when samples match
+DEFAULT_COMPARE_MODE = 'size'
+COMPARE_MODE = DEFAULT_COMPARE_MODE
+FINGERPRINT_BLOCK = 1024 * 1024
+FINGERPRINT_THREADS = 4
+FINGERPRINT_VERIFY_TIES = True
+
+# Graveyarding a duplicate can hardlink the files that are identical to the archive copy instead of copying them
+GRAVEYARD_HARDLINKS = False
+
+# Archive catalog: archived objects keyed by normalized name, so renamed releases are still found.
+# Only objects moved into one of CATALOG_ROOTS (the archive directories) are cataloged
+CATALOG_ROOTS = set()
+CATALOG_THREADS = 8
+# Only these are stripped as extensions, and only from files: directory names are full of dotted tags (.720p)
+NAME_FILE_EXTENSIONS = {'mkv', 'mp4', 'm4v', 'avi', 'mov', 'wmv', 'mpg', 'mpeg', 'ts', 'm2ts', 'iso', 'img',
+                        'flac', 'mp3', 'm4a', 'aac', 'ogg', 'wav', 'epub', 'mobi', 'azw3', 'pdf', 'cbr', 'cbz',
+                        'srt', 'sub', 'idx', 'nfo', 'txt', 'rar', 'zip', '7z', 'tar', 'gz'}
+# Tags that end in what looks like a release group, but aren't one
+NAME_HYPHENATED_TAGS = ('WEB-DL', 'WEB-RIP', 'BLU-RAY', 'HD-DVD', 'DVD-R', 'BD-R', 'DTS-HD', 'DTS-X')
+# Bumped whenever normalize_name changes, so the cataloged names are recomputed
+CATALOG_NORM_VERSION = 1
+
+# Planner estimates. The copy rate is what the archive disk sustains; renames and unlinks are near free
+DEFAULT_COPY_RATE_MBPS = 100
+RENAME_SECONDS = 0.01
+PLAN_ACTION_ORDER = {'unlink': 0, 'graveyard': 1, 'archive': 1, 'replace': 1}
+
+# Free-space watermarks (percent used) for the source volume, and the headroom kept free on the destination
+DEFAULT_WATERMARK_GAP = 10
+DEFAULT_WATERMARK_ORDER = 'oldest'
+DEST_FREE_RESERVE = 1024 * 1024 * 1024
+
+# Graveyard retention. An item's age is counted from when it landed in the Graveyard (its ctime). Items whose
+# whole content is also in Media_Archive are confirmed duplicates and are evicted first
+GRAVEYARD_DUPLICATE_RELATIONS = ('identical', 'subset')
+DAY_SECONDS = 24 * 60 * 60
+
+# Daemon mode. Inotify is used on Linux, otherwise the source directory is polled
+DEFAULT_POLL_INTERVAL = 30
+DEFAULT_TRANSMISSION_INTERVAL = 30
+INOTIFY_MASK = 0x00000008 | 0x00000040 | 0x00000080 | 0x00000100 | 0x00000200 | 0x00004000  # CLOSE_WRITE, MOVED_*, CREATE, DELETE, Q_OVERFLOW
+_DAEMON_STATE = {'stop': False, 'idle': False}
+
+# Runs that move objects hold an exclusive lock. Scheduled runs give up straight away if it is taken;
+# the torrent-done hook and the daemon wait for it
+RUN_LOCK_TIMEOUT = 30 * 60
+_RUN_LOCK = {'fd': None}
+
+# Transmission RPC. Only these fields are requested, and recent snapshots are refreshed with 'recently-active'
+TRANSMISSION_HOST = os.getenv('TRANSMISSION_HOST', 'localhost')
+TRANSMISSION_PORT = int(os.getenv('TRANSMISSION_PORT', '9091'))
+TORRENT_FIELDS = ['id', 'name', 'hashString', 'percentDone', 'status', 'downloadDir']
+RECENTLY_ACTIVE_WINDOW = 55  # Transmission reports activity and removals from the last 60 seconds
+FULL_REFRESH_INTERVAL = 600
+TORRENT_FILES_BATCH = 200
+_TRANSMISSION_CLIENTS = {}
+
+# RAR archives. Headers are read in-process; 7z is only a fallback for archives the reader can't handle
+SEVEN_ZIP_PATH = '/usr/local/bin/7z'
+RAR4_SIGNATURE = b'Rar!\x1a\x07\x00'
+RAR5_SIGNATURE = b'Rar!\x1a\x07\x01\x00'
+RAR_SIGNATURE_SEARCH = 1024 * 1024  # Self-extracting archives carry a stub before the signature
+RAR_VOLUME_NEW = re.compile(r'^(?P<base>.+)\.part(?P<num>\d+)\.rar$', re.IGNORECASE)
+RAR_VOLUME_OLD = re.compile(r'^(?P<base>.+)\.(?P<ext>rar|[r-z]\d\d)$', re.IGNORECASE)
+
+# Unpacked files are only scrubbed once their CRC32 matches the one in the RAR headers
+VERIFY_SCRUB = True
+CRC_CHUNK = 64 * 1024 * 1024
+CRC_THREADS = 4
+
+# Structured run log (JSON lines), written through a large buffer
+RUN_LOG_BUFFER_SIZE = 1024 * 1024
+RUN_ID = START_TIME.isoformat(timespec='seconds')
+STAGE_RECORDS = []
+_RUN_LOG = {'file': None, 'path': None}
+_RUN_LOG_LOCK = threading.Lock()
+
+# Profiling. cProfile wraps the outermost stage on each thread and the results are merged into one report;
+# the sampler only looks at thread stacks every interval, so it is cheap enough to leave on
+PROFILE_SAMPLE_INTERVAL = 0.02
+PROFILE_TOP = 30
+_PROFILE = {
+    'enabled': False,
+    'memory': False,
+    'stats': None,
+    'snapshots': [],
+    'sampler': None,
+    'samples': 0,
+    'self': {},
+    'inclusive': {},
+    'lock': threading.Lock()
+}
+
+# Per-item log buffering and per-device move slots
+_LOG_CONTEXT = threading.local()
+_PRINT_LOCK = threading.Lock()
+_DEVICE_SLOTS = {}
+_DEVICE_SLOTS_LOCK = threading.Lock()
+_DEST_RESERVED = {}
+DEFERRED_ITEMS = []
+
 # Define file system base paths
 USER_VOLUME = pathlib.Path.home()
-SOURCE_VOLUME = os.getenv('TORBASE')
-ARCHIVE_VOLUME = os.getenv('TORARCHIVE')
+# ARCHIVE_CACHE_DIR and ARCHIVE_LOG_DIR override the platform defaults (used to sandbox the benchmarks)
+if os.getenv('ARCHIVE_CACHE_DIR'):
+    CACHE_DIR = os.getenv('ARCHIVE_CACHE_DIR')
+elif sys.platform == 'darwin':
+    CACHE_DIR = os.path.join(USER_VOLUME, 'Library', 'Caches', 'Archive_Completed_Objects')
+else:
+    CACHE_DIR = os.path.join(os.getenv('XDG_CACHE_HOME', os.path.join(USER_VOLUME, '.cache')), 'archive_completed_objects')
+CACHE_DB_PATH = os.path.join(CACHE_DIR, 'cache.sqlite')
+RUN_LOCK_PATH = os.path.join(CACHE_DIR, 'run.lock')
+if os.getenv('ARCHIVE_LOG_DIR'):
+    LOG_DIR = os.getenv('ARCHIVE_LOG_DIR')
+elif sys.platform == 'darwin':
+    LOG_DIR = os.path.join(USER_VOLUME, 'Library', 'Logs', 'Archive_Completed_Objects')
+else:
+    LOG_DIR = os.path.join(os.getenv('XDG_STATE_HOME', os.path.join(USER_VOLUME, '.local', 'state')),
+                           'archive_completed_objects', 'logs')
+CONFIG_PATH = os.path.join(os.getenv('XDG_CONFIG_HOME', os.path.join(USER_VOLUME, '.config')),
+                           'archive_completed_objects', 'config')
+PROFILE_PATH = '/Users/scott/.bash_profile'
+REQUIRED_ENV_KEYS = ('TORBASE', 'TORARCHIVE')
+ENV_KEYS = REQUIRED_ENV_KEYS + ('TRANSMISSION_HOST', 'TRANSMISSION_PORT')
+STARTUP_TIMINGS = []
+
+# Set by load_environment()
+SOURCE_VOLUME = None
+ARCHIVE_VOLUME = None
 #############################################################################################################
 def execution_env_is_dev(paths_dict):
     print(f'{MARKER_CHAR * 140}')
@@ -58,17 +357,29 @@ def check_if_object_exists_at_dest(dest_dir, o):
     dest_object_path = os.path.join(dest_dir, pathlib.PurePosixPath(o).name)
 
     # Check if version exists
+    compare_dict = None
     if os.path.exists(dest_object_path):
-        # Version exists, so compare sizes
-        # Join Source dir and object
-        source_object_path = os.path.join(dest_dir, pathlib.PurePosixPath(o).name)
-        compare_dict = compare_size_of_two_objects(source_object_path, dest_object_path)
+        # Version exists, so compare sizes of the source object (full path) and the archived copy
+        source_object_path = o
+        if COMPARE_MODE == 'fingerprint':
+            compare_dict = compare_fingerprints_of_two_objects(source_object_path, dest_object_path)
+        else:
+            compare_dict = compare_size_of_two_objects(source_object_path, dest_object_path)
+    elif os.path.abspath(dest_dir) in CATALOG_ROOTS:
+        # No copy under the same name, but a renamed release may be cataloged
+        compare_dict = find_catalog_match(o)
+        if compare_dict:
+            dest_object_path = compare_dict['path']
+
+    if compare_dict:
         exists_dict = {
             'exists': True,
             'type': compare_dict['type'],
             'source_size': compare_dict['obj_size'],
             'dest_size': compare_dict['archive_size'],
-            'action': compare_dict['action']
+            'dest_path': dest_object_path,
+            'action': compare_dict['action'],
+            'relation': compare_dict.get('relation')
         }
     else:
         exists_dict = {
@@ -79,24 +390,481 @@ def check_if_object_exists_at_dest(dest_dir, o):
 
 
 #############################################################################################################
-def classify_directory_contents(directory_path, contents):
-    # Classify object prior to processing
-    # Initialize dictionaries to store classifications
-    files = []
-    directories = []
-    symlinks = []
-
-    # Iterate over each item in the directory
+def classify_entries(directory_path, contents):
+    # Classify objects prior to processing, yielding (name, type). One lstat per object
     for item in contents:
-        item_path = os.path.join(directory_path, item)
+        try:
+            mode = os.lstat(os.path.join(directory_path, item)).st_mode
+        except OSError:
+            continue
+        if stat.S_ISLNK(mode):
+            yield item, 'symlink'
+        elif stat.S_ISREG(mode):
+            yield item, 'file'
+        elif stat.S_ISDIR(mode):
+            yield item, 'directory'
+#############################################################################################################
+
+
+#############################################################################################################
+def count_entries(work_items, counts):
+    # Pass (name, type) pairs through, counting them by type
+    for item in work_items:
+        counts[item[1]] = counts.get(item[1], 0) + 1
+        yield item
+#############################################################################################################
+
+
+#############################################################################################################
+def cache_db():
+    # Shared connection to the on-disk cache, created on first use
+    global _CACHE_DB
+    with _CACHE_DB_LOCK:
+        if _CACHE_DB is None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            _CACHE_DB = sqlite3.connect(CACHE_DB_PATH, check_same_thread=False, isolation_level=None)
+            _CACHE_DB.execute('PRAGMA journal_mode=WAL')
+            _CACHE_DB.execute('PRAGMA synchronous=NORMAL')
+            _CACHE_DB.execute('CREATE TABLE IF NOT EXISTS dir_sizes ('
+                              'path TEXT PRIMARY KEY, parent TEXT, mtime_ns INTEGER, '
+                              'size INTEGER, files INTEGER, max_mtime REAL, scanned REAL, linked INTEGER)')
+            if 'linked' not in [r[1] for r in _CACHE_DB.execute('PRAGMA table_info(dir_sizes)')]:
+                # Caches from before hardlink accounting. NULL rows are rescanned on first use
+                _CACHE_DB.execute('ALTER TABLE dir_sizes ADD COLUMN linked INTEGER')
+            _CACHE_DB.execute('CREATE INDEX IF NOT EXISTS dir_sizes_parent ON dir_sizes (parent)')
+            _CACHE_DB.execute('CREATE TABLE IF NOT EXISTS fingerprints ('
+                              'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, sample TEXT, full TEXT)')
+            _CACHE_DB.execute('CREATE TABLE IF NOT EXISTS moves ('
+                              'source TEXT PRIMARY KEY, dest TEXT, staging TEXT, state TEXT, started REAL)')
+            _CACHE_DB.execute('CREATE TABLE IF NOT EXISTS catalog ('
+                              'path TEXT PRIMARY KEY, norm TEXT, size INTEGER, files INTEGER, '
+                              'fingerprint TEXT, mtime_ns INTEGER, indexed REAL)')
+            _CACHE_DB.execute('CREATE INDEX IF NOT EXISTS catalog_norm ON catalog (norm)')
+            if _CACHE_DB.execute('PRAGMA user_version').fetchone()[0] < CATALOG_NORM_VERSION:
+                for path, in _CACHE_DB.execute('SELECT path FROM catalog').fetchall():
+                    _CACHE_DB.execute('UPDATE catalog SET norm = ? WHERE path = ?',
+                                      (normalize_name(os.path.basename(path), os.path.isfile(path)), path))
+                _CACHE_DB.execute(f'PRAGMA user_version = {CATALOG_NORM_VERSION}')
+            _CACHE_DB.execute('CREATE TABLE IF NOT EXISTS crc32s ('
+                              'path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, crc INTEGER)')
+            _CACHE_DB.execute('CREATE TABLE IF NOT EXISTS failures ('
+                              'path TEXT PRIMARY KEY, type TEXT, reason TEXT, attempts INTEGER, '
+                              'mtime_ns INTEGER, last_failed REAL, next_eligible REAL)')
+            _CACHE_DB.execute('CREATE TABLE IF NOT EXISTS move_files ('
+                              'source TEXT, rel_path TEXT, size INTEGER, PRIMARY KEY (source, rel_path))')
+        return _CACHE_DB
+#############################################################################################################
+
+
+#############################################################################################################
+def _delete_cached_subtree(db, path):
+    # '0' is the character after '/', so this range matches everything below path
+    db.execute('DELETE FROM dir_sizes WHERE path = ? OR (path >= ? AND path < ?)', (path, f'{path}/', f'{path}0'))
+#############################################################################################################
+
+
+#############################################################################################################
+def _cached_dir_stats(db, dir_path):
+    # A directory's mtime changes whenever an entry is added, removed or renamed in it, so an unchanged
+    # mtime means its own file totals and its list of subdirectories can be reused. Files rewritten in place
+    # are not detected, which is fine for write-once archive objects. The same goes for 'linked' (bytes in
+    # files with other hardlinks), which isn't updated when the other link is removed elsewhere
+    try:
+        st = os.stat(dir_path)
+    except OSError:
+        with _CACHE_DB_LOCK:
+            _delete_cached_subtree(db, dir_path)
+        return {'size': 0, 'files': 0, 'max_mtime': 0.0, 'linked': 0}
+
+    with _CACHE_DB_LOCK:
+        row = db.execute('SELECT mtime_ns, size, files, max_mtime, linked FROM dir_sizes WHERE path = ?',
+                         (dir_path,)).fetchone()
+        if row and row[0] == st.st_mtime_ns and row[4] is not None:
+            SIZE_CACHE_STATS['hits'] += 1
+            totals = {'size': row[1], 'files': row[2], 'max_mtime': row[3], 'linked': row[4]}
+            subdirs = [r[0] for r in db.execute('SELECT path FROM dir_sizes WHERE parent = ?', (dir_path,))]
+        else:
+            SIZE_CACHE_STATS['misses'] += 1
+            row = None
+
+    if row is None:
+        totals = {'size': 0, 'files': 0, 'max_mtime': 0.0, 'linked': 0}
+        subdirs = []
+        with os.scandir(dir_path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_symlink():
+                        continue
+                    if entry.is_dir():
+                        subdirs.append(entry.path)
+                    elif entry.is_file():
+                        entry_stat = entry.stat()
+                        totals['size'] += entry_stat.st_size
+                        totals['files'] += 1
+                        totals['max_mtime'] = max(totals['max_mtime'], entry_stat.st_mtime)
+                        if entry_stat.st_nlink > 1:
+                            totals['linked'] += entry_stat.st_size
+                except OSError:
+                    continue
+
+        with _CACHE_DB_LOCK:
+            db.execute('INSERT OR REPLACE INTO dir_sizes VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                       (dir_path, os.path.dirname(dir_path), st.st_mtime_ns, totals['size'], totals['files'],
+                        totals['max_mtime'], time.time(), totals['linked']))
+            # Forget subdirectories that have gone away since the last scan
+            known = [r[0] for r in db.execute('SELECT path FROM dir_sizes WHERE parent = ?', (dir_path,))]
+            for stale in set(known) - set(subdirs):
+                _delete_cached_subtree(db, stale)
+
+    for subdir in subdirs:
+        sub_totals = _cached_dir_stats(db, subdir)
+        totals['size'] += sub_totals['size']
+        totals['files'] += sub_totals['files']
+        totals['max_mtime'] = max(totals['max_mtime'], sub_totals['max_mtime'])
+        totals['linked'] += sub_totals['linked']
+    return totals
+#############################################################################################################
+
+
+#############################################################################################################
+def cached_tree_stats(dir_path):
+    # Same result as scan_tree, but only re-reads directories whose mtime changed since they were cached
+    return _cached_dir_stats(cache_db(), os.path.abspath(dir_path).rstrip(os.sep))
+#############################################################################################################
+
+
+#############################################################################################################
+def get_archive_directory_size(dir_path):
+    if SIZE_CACHE_ENABLED:
+        try:
+            return cached_tree_stats(dir_path)['size']
+        except sqlite3.Error as e:
+            print_string('{:4}{:<24}{:<60}'.format('', 'Size cache error:', str(e)))
+    return get_directory_size(dir_path)
+#############################################################################################################
+
+
+#############################################################################################################
+def run_size_cache_command(command, paths_dict):
+    db = cache_db()
+    archive_dir = os.path.abspath(paths_dict['archive_dir']).rstrip(os.sep)
+    print_string('{:<28}{:<60}'.format('Action:', f'Size cache {command}'))
+    print_string('{:<28}{:<60}'.format('Cache database:', CACHE_DB_PATH))
+
+    if command == 'rebuild':
+        with _CACHE_DB_LOCK:
+            _delete_cached_subtree(db, archive_dir)
+        for entry in os.scandir(archive_dir):
+            if entry.is_dir(follow_symlinks=False):
+                cached_tree_stats(entry.path)
+
+    elif command == 'prune':
+        removed = 0
+        with _CACHE_DB_LOCK:
+            paths = [r[0] for r in db.execute('SELECT path FROM dir_sizes')]
+        for path in paths:
+            if not os.path.isdir(path):
+                with _CACHE_DB_LOCK:
+                    removed += db.execute('DELETE FROM dir_sizes WHERE path = ?', (path,)).rowcount
+        db.execute('VACUUM')
+        print_string('{:<28}{:<60}'.format('Pruned entries:', removed))
+
+    with _CACHE_DB_LOCK:
+        total_rows = db.execute('SELECT COUNT(*) FROM dir_sizes').fetchone()[0]
+        archive_rows = db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM dir_sizes WHERE path >= ? AND path < ?',
+                                  (f'{archive_dir}/', f'{archive_dir}0')).fetchone()
+    print_string('{:<28}{:<60}'.format('Cached directories:', total_rows))
+    print_string('{:<28}{:<60}'.format('Under archive:', f'{archive_rows[0]} ({hm.naturalsize(archive_rows[1])})'))
+    print_string('{:<28}{:<60}'.format('Cache file size:', hm.naturalsize(os.path.getsize(CACHE_DB_PATH))))
+    if SIZE_CACHE_STATS['hits'] or SIZE_CACHE_STATS['misses']:
+        print_size_cache_stats()
+#############################################################################################################
+
+
+#############################################################################################################
+def print_size_cache_stats():
+    print_string('{:<28}{:<60}'.format('Size cache:', f"{SIZE_CACHE_STATS['hits']} hits / "
+                                                          f"{SIZE_CACHE_STATS['misses']} misses"))
+#############################################################################################################
+
+
+#############################################################################################################
+def _hash_file_range(f, offset, length, digest):
+    f.seek(offset)
+    remaining = length
+    while remaining:
+        block = f.read(min(remaining, BUFFERED_COPY_SIZE))
+        if not block:
+            break
+        digest.update(block)
+        remaining -= len(block)
+#############################################################################################################
+
+
+#############################################################################################################
+def _compute_fingerprint(path, size, full):
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(size.to_bytes(8, 'little'))
+    with open(path, 'rb') as f:
+        if full or size <= 3 * FINGERPRINT_BLOCK:
+            _hash_file_range(f, 0, size, digest)
+        else:
+            for offset in (0, (size - FINGERPRINT_BLOCK) // 2, size - FINGERPRINT_BLOCK):
+                _hash_file_range(f, offset, FINGERPRINT_BLOCK, digest)
+    return digest.hexdigest()
+#############################################################################################################
+
+
+#############################################################################################################
+def fingerprint_file(path, full=False, st=None):
+    # Cached per (path, size, mtime). Small files are hashed whole, so their sample is also their full hash
+    st = st or os.stat(path)
+    db = cache_db()
+    with _CACHE_DB_LOCK:
+        row = db.execute('SELECT size, mtime_ns, sample, full FROM fingerprints WHERE path = ?', (path,)).fetchone()
+    if not row or row[0] != st.st_size or row[1] != st.st_mtime_ns:
+        row = (st.st_size, st.st_mtime_ns, None, None)
+
+    sample, full_hash = row[2], row[3]
+    if sample is None:
+        sample = _compute_fingerprint(path, st.st_size, False)
+        if st.st_size <= 3 * FINGERPRINT_BLOCK:
+            full_hash = sample
+    if full and full_hash is None:
+        full_hash = _compute_fingerprint(path, st.st_size, True)
+
+    if (sample, full_hash) != (row[2], row[3]):
+        with _CACHE_DB_LOCK:
+            db.execute('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?, ?)',
+                       (path, st.st_size, st.st_mtime_ns, sample, full_hash))
+    return full_hash if full else sample
+#############################################################################################################
+
+
+#############################################################################################################
+def list_tree_files(obj_path):
+    # {relative path: stat} for every regular file in an object (a single file maps to '')
+    if not os.path.isdir(obj_path):
+        return {'': os.stat(obj_path)}
+
+    files = {}
+    pending = ['']
+    while pending:
+        rel_dir = pending.pop()
+        with os.scandir(os.path.join(obj_path, rel_dir)) as entries:
+            for entry in entries:
+                rel_path = os.path.join(rel_dir, entry.name)
+                if entry.is_dir(follow_symlinks=False):
+                    pending.append(rel_path)
+                elif entry.is_file(follow_symlinks=False):
+                    files[rel_path] = entry.stat(follow_symlinks=False)
+    return files
+#############################################################################################################
+
+
+#############################################################################################################
+def tree_file_path(obj_path, rel_path):
+    # Inverse of list_tree_files: a single file object is its own '' entry
+    return os.path.join(obj_path, rel_path) if rel_path else obj_path
+#############################################################################################################
+
+
+#############################################################################################################
+def files_are_identical(src_path, dest_path, src_stat, dest_stat, verify=True):
+    if src_stat.st_size != dest_stat.st_size:
+        return False
+    if fingerprint_file(src_path, st=src_stat) != fingerprint_file(dest_path, st=dest_stat):
+        return False
+    if not verify:
+        return True
+    return fingerprint_file(src_path, True, src_stat) == fingerprint_file(dest_path, True, dest_stat)
+#############################################################################################################
+
+
+#############################################################################################################
+def match_identical_files(obj_src, obj_dest, src_files, dest_files):
+    # Relative paths whose content is the same in both objects, without reading whole files unless the
+    # sampled fingerprints match
+    common = [p for p in src_files.keys() & dest_files.keys() if src_files[p].st_size == dest_files[p].st_size]
+
+    # Cheap tier first, for every candidate pair
+    sampled = [p for p in common
+               if files_are_identical(tree_file_path(obj_src, p), tree_file_path(obj_dest, p),
+                                      src_files[p], dest_files[p], verify=False)]
+
+    # Full hashes only for the pairs whose samples tie, in parallel
+    if FINGERPRINT_VERIFY_TIES and sampled:
+        def verify(p):
+            return files_are_identical(tree_file_path(obj_src, p), tree_file_path(obj_dest, p),
+                                       src_files[p], dest_files[p])
+        with ThreadPoolExecutor(max_workers=FINGERPRINT_THREADS) as executor:
+            matched = {p for p, same in zip(sampled, executor.map(verify, sampled)) if same}
+    else:
+        matched = set(sampled)
+    return matched
+#############################################################################################################
+
+
+#############################################################################################################
+def compare_fingerprints_of_two_objects(obj_src, obj_dest):
+    # Classify the pair as identical, superset (source has everything in the archive and more),
+    # subset or different
+    src_files = list_tree_files(obj_src)
+    dest_files = list_tree_files(obj_dest)
+    matched = match_identical_files(obj_src, obj_dest, src_files, dest_files)
+
+    src_only = src_files.keys() - matched
+    dest_only = dest_files.keys() - matched
+    if not src_only and not dest_only:
+        relation = 'identical'
+    elif not dest_only:
+        relation = 'superset'
+    elif not src_only:
+        relation = 'subset'
+    else:
+        relation = 'different'
+
+    source_obj_size = sum(st.st_size for st in src_files.values())
+    dest_obj_size = sum(st.st_size for st in dest_files.values())
+    # A different object of the same size is not a duplicate, so the newer one wins the tie
+    if relation == 'superset' or (relation == 'different' and dest_obj_size <= source_obj_size):
+        action = 'archive'
+    else:
+        action = 'graveyard'
+
+    return {
+        'name': pathlib.PurePosixPath(obj_src).name,
+        'type': 'dir' if os.path.isdir(obj_src) else 'file',
+        'obj_size': source_obj_size,
+        'archive_size': dest_obj_size,
+        'relation': relation,
+        'action': action
+    }
+#############################################################################################################
+
+
+#############################################################################################################
+def normalize_name(name, is_file=False):
+    # Case, punctuation, a file's media extension, bracketed tags and a trailing release group ('-GROUP')
+    # are ignored. The extension goes first, as the group sits before it
+    if is_file:
+        stem, ext = os.path.splitext(name)
+        if ext[1:].lower() in NAME_FILE_EXTENSIONS:
+            name = stem
+    name = re.sub(r'[\[({][^\])}]*[\])}]', ' ', name).strip()
+    group = re.search(r'-[A-Za-z][A-Za-z0-9]*$', name)
+    if group and not name.upper().endswith(NAME_HYPHENATED_TAGS):
+        name = name[:group.start()]
+    return ' '.join(re.findall(r'[a-z0-9]+', name.lower()))
+#############################################################################################################
+
+
+#############################################################################################################
+def object_signature(obj_path):
+    # Total size, file count and one fingerprint over every file's relative path, size and sampled hash
+    files = list_tree_files(obj_path)
+    digest = hashlib.blake2b(digest_size=16)
+    for rel_path in sorted(files):
+        st = files[rel_path]
+        digest.update(f'{rel_path}\0{st.st_size}\0{fingerprint_file(tree_file_path(obj_path, rel_path), st=st)}\n'.encode())
+    return {'size': sum(st.st_size for st in files.values()), 'files': len(files), 'fingerprint': digest.hexdigest()}
+#############################################################################################################
+
+
+#############################################################################################################
+def catalog_add(dest_path, signature):
+    db = cache_db()
+    with _CACHE_DB_LOCK:
+        db.execute('INSERT OR REPLACE INTO catalog VALUES (?, ?, ?, ?, ?, ?, ?)',
+                   (dest_path, normalize_name(os.path.basename(dest_path), os.path.isfile(dest_path)),
+                    signature['size'], signature['files'], signature['fingerprint'], os.lstat(dest_path).st_mtime_ns,
+                    time.time()))
+#############################################################################################################
+
+
+#############################################################################################################
+def catalog_remove(path):
+    with _CACHE_DB_LOCK:
+        cache_db().execute('DELETE FROM catalog WHERE path = ?', (path,))
+#############################################################################################################
+
+
+#############################################################################################################
+def catalog_lookup(obj_full_path):
+    # Archived objects whose normalized name matches, with stale rows dropped. One indexed query,
+    # no archive directory scan
+    with _CACHE_DB_LOCK:
+        rows = cache_db().execute('SELECT path, size, files, fingerprint FROM catalog WHERE norm = ?',
+                                  (normalize_name(os.path.basename(obj_full_path),
+                                                  os.path.isfile(obj_full_path)),)).fetchall()
+    candidates = []
+    for path, size, files, fingerprint in rows:
+        if os.path.lexists(path):
+            candidates.append({'path': path, 'size': size, 'files': files, 'fingerprint': fingerprint})
+        else:
+            catalog_remove(path)
+    return candidates
+#############################################################################################################
+
 
-        if os.path.islink(item_path):
-            symlinks.append(item)
-        elif os.path.isfile(item_path):
-            files.append(item)
-        elif os.path.isdir(item_path):
-            directories.append(item)
-    return files, directories, symlinks
+#############################################################################################################
+def find_catalog_match(obj_full_path):
+    # A renamed copy only counts as a match on content: identical (by signature, or file by file), a subset
+    # or a superset. Names alone could pair two different releases
+    candidates = [c for c in catalog_lookup(obj_full_path)
+                  if os.path.basename(c['path']) != os.path.basename(obj_full_path)]
+    if not candidates:
+        return None
+    signature = object_signature(obj_full_path)
+    for candidate in candidates:
+        if candidate['fingerprint'] == signature['fingerprint']:
+            return {'path': candidate['path'], 'type': 'dir' if os.path.isdir(obj_full_path) else 'file',
+                    'obj_size': signature['size'], 'archive_size': candidate['size'],
+                    'relation': 'identical', 'action': 'graveyard'}
+    for candidate in candidates:
+        compare_dict = compare_fingerprints_of_two_objects(obj_full_path, candidate['path'])
+        if compare_dict['relation'] != 'different':
+            return {'path': candidate['path'], **compare_dict}
+    return None
+#############################################################################################################
+
+
+#############################################################################################################
+def rebuild_catalog(archive_dir, threads=CATALOG_THREADS):
+    # Re-index every top level archive object in parallel, replacing the catalog
+    archive_dir = os.path.abspath(archive_dir)
+    with os.scandir(archive_dir) as entries:
+        paths = [e.path for e in entries if not e.name.startswith('.') and not e.is_symlink()]
+
+    def index(path):
+        try:
+            return path, object_signature(path)
+        except OSError as e:
+            print_string('{:4}{:<24}{:<60}'.format('', 'Catalog error:', f'{path}: {str(e)}'))
+            return path, None
+
+    with _CACHE_DB_LOCK:
+        cache_db().execute('DELETE FROM catalog')
+    indexed = 0
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for path, signature in executor.map(index, paths):
+            if signature:
+                catalog_add(path, signature)
+                indexed += 1
+    return indexed
+#############################################################################################################
+
+
+#############################################################################################################
+def graveyard_links(obj_full_path, archive_path, dest_path):
+    # {source file: archive file} for the files that can be hardlinked to the archive copy rather than copied.
+    # Hardlinks can't cross devices, so nothing is linked unless the archive copy and the Graveyard share one
+    if not os.path.exists(archive_path) or os.stat(archive_path).st_dev != os.stat(dest_path).st_dev:
+        return {}
+    src_files = list_tree_files(obj_full_path)
+    dest_files = list_tree_files(archive_path)
+    matched = match_identical_files(obj_full_path, archive_path, src_files, dest_files)
+    return {tree_file_path(obj_full_path, p): tree_file_path(archive_path, p) for p in matched}
 #############################################################################################################
 
 
@@ -109,7 +877,7 @@ def compare_size_of_two_objects(obj_src, obj_dest):
     else:
         source_obj_type = 'dir'
         source_obj_size = get_directory_size(obj_src)
-        dest_obj_size = get_directory_size(obj_dest)
+        dest_obj_size = get_archive_directory_size(obj_dest)
 
     results_dict = {
         'name': pathlib.PurePosixPath(obj_src).name,
@@ -161,12 +929,36 @@ def has_rar(obj_full_path):
 
 #############################################################################################################
 def instance_check(paths_dict, obj_full_path):
-    exists_dict = check_if_object_exists_at_dest(paths_dict['archive_dir'], os.path.basename(obj_full_path))
+    with stage_timer('compare') as record:
+        exists_dict = check_if_object_exists_at_dest(paths_dict['archive_dir'], obj_full_path)
+        record['exists'] = exists_dict['exists']
+        if exists_dict['exists']:
+            record.update(bytes=exists_dict['source_size'], dest_bytes=exists_dict['dest_size'],
+                          action=exists_dict['action'], relation=exists_dict['relation'])
+
+    if exists_dict['exists'] and os.path.basename(exists_dict['dest_path']) != os.path.basename(obj_full_path):
+        print_string('{:4}{:<24}{:<60}'.format('', 'Catalog match:', os.path.basename(exists_dict['dest_path'])))
+    if exists_dict['exists'] and exists_dict['relation']:
+        print_string('{:4}{:<24}{:<60}'.format('', 'Archive content:', exists_dict['relation'].upper()))
+
+    if exists_dict['exists'] and exists_dict['action'] == 'archive':
+        # Source is larger than the archived copy. Retire the archived copy to the Graveyard, then archive
+        print_string('{:4}{:<24}{:<60}'.format('', 'Archive instance:', 'Lower quality found. Moving it to Graveyard'))
+        archived_path = exists_dict['dest_path']
+        retire_dict = process_object(archived_path, paths_dict['graveyard_dir'])
+        if retire_dict['result'] != 'success':
+            print_string('{:4}{:<24}{:<60}'.format('', 'Graveyarding response:', retire_dict['response']))
+            return 'failed'
 
     if exists_dict['exists'] and exists_dict['action'] == 'graveyard':
         print_string('{:4}{:<24}{:<60}'.format('', 'Archive instance:', 'Similar quality found. Moving to Graveyard'))
-        process_object_dict = process_object(obj_full_path, paths_dict['graveyard_dir'])
+        link_from = exists_dict['dest_path'] if GRAVEYARD_HARDLINKS else None
+        process_object_dict = process_object(obj_full_path, paths_dict['graveyard_dir'], link_from)
         print_string('{:4}{:<24}{:<60}'.format('', 'Graveyarding result:', process_object_dict['result'].upper()))
+        print_transfer_stats(process_object_dict)
+        if process_object_dict['result'] == 'deferred':
+            print_string('{:4}{:<24}{:<60}'.format('', 'Graveyarding response:', process_object_dict['response']))
+            return 'deferred'
         if process_object_dict['result'] == 'failed':
             print_string('{:4}{:<24}{:<60}'.format('', 'Graveyarding response:', process_object_dict['response']))
             print_string('{:4}{:<24}{:<60}'.format('', 'Next stage', 'Moving to Trash'))
@@ -175,37 +967,34 @@ def instance_check(paths_dict, obj_full_path):
             return 'failed'
         return 'success'
     else:
-        print_string('{:4}{:<24}{:<60}'.format('', 'Archive instance:', 'None found. Moving to Archive'))
+        if not exists_dict['exists']:
+            print_string('{:4}{:<24}{:<60}'.format('', 'Archive instance:', 'None found. Moving to Archive'))
         process_object_dict = process_object(obj_full_path, paths_dict['archive_dir'])
         print_string('{:4}{:<24}{:<60}'.format('', 'Archiving result:', process_object_dict['result'].upper()))
+        print_transfer_stats(process_object_dict)
         if process_object_dict['result'] != 'success':
             print_string('{:4}{:<24}{:<60}'.format('', 'Archiving response:', process_object_dict['response']))
-            return 'failed'
+            return process_object_dict['result']
         return 'success'
 #############################################################################################################
 
 
 #############################################################################################################
-def get_active_transmission_objects():
-    print_string('{:<28}{:<60}'.format('Action:', 'Fetch objects from Transmission API'))
-    objects = []
+def get_active_transmission_objects(exit_on_error=True, host=None, port=None):
+    host, port = host or TRANSMISSION_HOST, port or TRANSMISSION_PORT
+    print_string('{:<28}{:<60}'.format('Action:', f'Fetch objects from Transmission API ({host}:{port})'
+                                       if (host, port) != (TRANSMISSION_HOST, TRANSMISSION_PORT)
+                                       else 'Fetch objects from Transmission API'))
     try:
-        response = t_rpc.Client(host='localhost', port=9091).get_torrents()
-
-        # Return empty list if empty response from Transmission
-        if not response:
-            return objects
-
-        for item in response:
-            class_dict = vars(item)
-            if not class_dict['fields']['name']:
-                continue
-            else:
-                objects.append(class_dict['fields']['name'])
-        return objects
+        torrents = poll_transmission_torrents(host, port)
+        torrent_files = get_torrent_files(host, port, torrents)
+        return build_torrent_index(torrents, torrent_files)
     except Exception as e:
-        # This is the end
         print_string('{:<28}"{:<60}"'.format('API poll attempt failed:', str(e)))
+        if not exit_on_error:
+            return None
+
+        # This is the end
         print(f'{MARKER_CHAR * 140}')
         print_string(f'Execution completed. Total runtime:\t {hm.precisedelta(dt.datetime.now() - START_TIME)}')
         print(f'{MARKER_CHAR * 140}')
@@ -215,266 +1004,2632 @@ def get_active_transmission_objects():
 
 
 #############################################################################################################
-def get_file_size(file_path):
-    return pathlib.Path(file_path).stat().st_size
+def get_torrent_files(host, port, torrents):
+    # File lists rarely change, so they are cached per torrent hash and name, and only fetched for new torrents
+    cache_path = os.path.join(CACHE_DIR, f'transmission_files_{host}_{port}.json')
+    try:
+        with open(cache_path) as f:
+            files_cache = json.load(f)
+    except (OSError, ValueError):
+        files_cache = {}
+
+    keys = {torrent_id: f"{t['hashString']}:{t['name']}" for torrent_id, t in torrents.items()}
+    missing = [torrent_id for torrent_id, key in keys.items() if key not in files_cache]
+    for i in range(0, len(missing), TORRENT_FILES_BATCH):
+        batch = missing[i:i + TORRENT_FILES_BATCH]
+        for t in get_transmission_client(host, port).get_torrents(ids=batch, arguments=['id', 'hashString', 'files']):
+            torrent_id = int(t.fields['id'])
+            if torrent_id in keys:
+                files_cache[keys[torrent_id]] = [f['name'] for f in t.fields.get('files') or []]
+
+    # Drop torrents that are no longer loaded
+    current = set(keys.values())
+    if missing or len(files_cache) != len(current):
+        files_cache = {k: v for k, v in files_cache.items() if k in current}
+        write_json_atomic(cache_path, files_cache)
+
+    return {torrent_id: files_cache.get(key, []) for torrent_id, key in keys.items()}
 #############################################################################################################
 
 
 #############################################################################################################
-def get_directory_size(dir_path):
-    return sum(f.stat().st_size for f in pathlib.Path(dir_path).rglob('*') if f.is_file())
+def build_torrent_index(torrents, torrent_files):
+    # Trie of every path Transmission still references, one nested dict level per path component
+    trie = {}
+    file_count = 0
+    for torrent_id, t in torrents.items():
+        download_dir = os.path.normpath(t.get('downloadDir') or '/')
+        # Torrents without metadata yet have no file list, so protect the torrent name instead
+        names = torrent_files.get(torrent_id) or ([t['name']] if t.get('name') else [])
+        for name in names:
+            node = trie
+            for part in pathlib.PurePosixPath(download_dir, name).parts:
+                node = node.setdefault(part, {})
+            file_count += 1
+
+    return {
+        'torrents': len(torrents),
+        'files': file_count,
+        'trie': trie
+    }
 #############################################################################################################
 
 
 #############################################################################################################
-def get_fs_objects(source_dir):
-    print_string('{:<28}{:<60}'.format('Action:', 'Fetching source filesystem objects'))
-    objects = []
-    try:
-        objects = os.listdir(source_dir)
-        objects = [o for o in objects if not o.endswith('.DS_Store')]
-    except Exception as e:
-        print_string(f'Error reading source filesystem:\t {str(e)}')
-
-    if not objects:
-        # This is the end
-        print_string('{:<28}"{:<60}"'.format('No file system objects fetched   ...Exiting...', ''))
-        print(f'{MARKER_CHAR * 140}')
-        print_string(f'Execution completed. Total runtime:\t {hm.precisedelta(dt.datetime.now() - START_TIME)}')
-        print(f'{MARKER_CHAR * 140}')
-        print(f'{MARKER_CHAR * 140}\n')
-        sys.exit(0)
-    return objects
+def is_torrent_object(torrent_index, obj_full_path):
+    # An object is in use if it is a referenced file, or a directory on the path to one
+    for candidate in {os.path.normpath(obj_full_path), os.path.realpath(obj_full_path)}:
+        node = torrent_index['trie']
+        for part in pathlib.PurePosixPath(candidate).parts:
+            node = node.get(part)
+            if node is None:
+                break
+        else:
+            return True
+    return False
 #############################################################################################################
 
 
 #############################################################################################################
-def process_object(obj_full_path, dest_path):
-    if not dest_path.__contains__('Trash'):
-        dest_label = re.sub(r'_dir|__DEV', '', dest_path.split('/')[-1])
-    else:
-        dest_label = 'Trash'
+def get_transmission_client(host, port):
+    # Reuse one client per daemon, which saves the session handshake on every poll
+    if (host, port) not in _TRANSMISSION_CLIENTS:
+        _TRANSMISSION_CLIENTS[(host, port)] = t_rpc.Client(host=host, port=port)
+    return _TRANSMISSION_CLIENTS[(host, port)]
+#############################################################################################################
+
 
+#############################################################################################################
+def write_json_atomic(path, data):
+    # Written under a unique temporary name, so concurrent writers never replace each other's half-written file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=f'.{os.path.basename(path)}.', suffix='.tmp')
     try:
-        shutil.move(obj_full_path, dest_path)
-        response_dict = {
-            'result': 'success',
-            'response': f'Object successfully moved to {dest_label}'
-        }
-    except OSError as e:
-        response_dict = {
-            'result': 'failed',
-            'response': f'Response: {str(e)}'
-        }
-    return response_dict
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.unlink(tmp_path)
+        raise
 #############################################################################################################
 
 
 #############################################################################################################
-def process_symlink(o):
-    try:
-        os.unlink(o)
-        # Unlinking successful
-        response_dict = {
-            'result': 'success',
-            'response': ''
-        }
-    except Exception as e:
-        # Unlinking failed
-        response_dict = {
-            'result': 'failed',
-            'response': f'Response: {str(e)}'
-        }
-    return response_dict
+def transmission_snapshot_path(host, port):
+    return os.path.join(CACHE_DIR, f'transmission_{host}_{port}.json')
 #############################################################################################################
 
 
 #############################################################################################################
-def print_env(paths_dict):
-    print_string('{:>25}{:3}{:<60}'.format('Source:', '', paths_dict['source_dir']))
-    print_string('{:>25}{:3}{:<60}'.format('Destination:', '', paths_dict['archive_dir']))
-    print_string('{:>25}{:3}{:<60}'.format('Trash:', '', paths_dict['trash_dir']))
-    print_string(f'{MARKER_CHAR * 100}')
+def load_transmission_snapshot(host, port):
+    try:
+        with open(transmission_snapshot_path(host, port)) as f:
+            snapshot = json.load(f)
+        snapshot['torrents'] = {int(k): v for k, v in snapshot['torrents'].items()}
+        return snapshot
+    except (OSError, ValueError, KeyError):
+        return None
 #############################################################################################################
 
 
 #############################################################################################################
-def print_obj_counts(files, directories, symlinks):
-    print_string('{:>30}{:3}{:<60}'.format('Symlinks:', '', len(symlinks)))
-    print_string('{:>30}{:3}{:<60}'.format('Files:', '', len(files)))
-    print_string('{:>30}{:3}{:<60}'.format('Directories:', '', len(directories)))
+def save_transmission_snapshot(host, port, snapshot):
+    write_json_atomic(transmission_snapshot_path(host, port), snapshot)
 #############################################################################################################
 
 
 #############################################################################################################
-def print_string(data):
-    print('{:<27}\t {:<}'.format(str(dt.datetime.now()), data))
-    sys.stdout.flush()
+def poll_transmission_torrents(host, port, fields=None):
+    # Returns {torrent id: fields}. A fresh snapshot is updated from the recently-active delta,
+    # otherwise all torrents are fetched (with the lean field list)
+    fields = fields or TORRENT_FIELDS
+    client = get_transmission_client(host, port)
+    snapshot = load_transmission_snapshot(host, port)
+    now = time.time()
+
+    incremental = (
+        snapshot is not None
+        and snapshot.get('fields') == fields
+        and now - snapshot['polled'] < RECENTLY_ACTIVE_WINDOW
+        and now - snapshot['full_refresh'] < FULL_REFRESH_INTERVAL
+    )
+    if incremental:
+        active, removed = client.get_recently_active_torrents(arguments=fields)
+        torrents = snapshot['torrents']
+        for torrent_id in removed:
+            torrents.pop(int(torrent_id), None)
+        for t in active:
+            torrents[int(t.fields['id'])] = {f: t.fields.get(f) for f in fields}
+        full_refresh = snapshot['full_refresh']
+    else:
+        torrents = {int(t.fields['id']): {f: t.fields.get(f) for f in fields}
+                    for t in client.get_torrents(arguments=fields)}
+        full_refresh = now
+
+    save_transmission_snapshot(host, port, {
+        'fields': fields,
+        'polled': now,
+        'full_refresh': full_refresh,
+        'torrents': torrents
+    })
+    return torrents
 #############################################################################################################
 
 
 #############################################################################################################
-def list_files_from_rar(archive_path):
-    target_list = []
-    rar_cmd = '/usr/local/bin/7z l'
-    year = str(dt.datetime.now().year)
+def get_file_size(file_path):
+    return pathlib.Path(file_path).stat().st_size
+#############################################################################################################
 
-    objects = os.listdir(archive_path)
-    rar_filename = [o for o in objects if o.endswith('.rar')]
-    if not rar_filename:
-        return None
 
-    rar_filename = ''.join(rar_filename)
-    rar_file_full_path = os.path.join(archive_path, rar_filename)
-    extract_cmd = f'{rar_cmd} "{rar_file_full_path}"'
+#############################################################################################################
+def get_directory_size(dir_path):
+    return scan_tree(dir_path)['size']
+#############################################################################################################
 
-    # Extract archive info into list, using 7zip
-    output = subprocess.run(
-        extract_cmd, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
-    )
 
-    # Decode and split the output
-    output_list = output.stdout.decode('utf-8').split()
+#############################################################################################################
+def _scan_subtree(root, follow_symlinks, visited, visited_lock, split_top=False):
+    # Iterative walk, relying on the type info cached in each DirEntry (no extra stat for directories)
+    totals = {'size': 0, 'files': 0, 'max_mtime': 0.0, 'linked': 0}
+    top_dirs = []
+    pending = [root]
+    while pending:
+        current = pending.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    try:
+                        if entry.is_symlink() and not follow_symlinks:
+                            continue
+                        if entry.is_dir(follow_symlinks=follow_symlinks):
+                            if follow_symlinks:
+                                # Only descend into each real directory once, so symlink loops terminate
+                                st = entry.stat()
+                                with visited_lock:
+                                    if (st.st_dev, st.st_ino) in visited:
+                                        continue
+                                    visited.add((st.st_dev, st.st_ino))
+                            if split_top and current == root:
+                                top_dirs.append(entry.path)
+                            else:
+                                pending.append(entry.path)
+                        elif entry.is_file(follow_symlinks=follow_symlinks):
+                            st = entry.stat(follow_symlinks=follow_symlinks)
+                            totals['size'] += st.st_size
+                            totals['files'] += 1
+                            totals['max_mtime'] = max(totals['max_mtime'], st.st_mtime)
+                            if st.st_nlink > 1:
+                                totals['linked'] += st.st_size
+                    except OSError:
+                        continue
+        except OSError:
+            continue
+    return totals, top_dirs
+#############################################################################################################
 
-    for item in output_list:
-        item_full_path = os.path.join(archive_path, item)
-        if pathlib.Path(item_full_path).is_file() and pathlib.PurePosixPath(item).suffix != '.rar':
-            # print(f'Suffix of {item} is {pathlib.PurePosixPath(item).suffix}')
-            target_list.append(item)
 
-    if len(target_list) == 1:
-        result = ''.join(target_list)
-        if os.path.exists(os.path.join(archive_path, result)):
-            return result
-        else:
-            return {'file': result, 'result': 'missing'}
+#############################################################################################################
+def scan_tree(dir_path, threads=None, symlink_policy=None):
+    # Returns total size, file count and newest file mtime of a directory tree
+    threads = threads or TREE_SCAN_THREADS
+    follow_symlinks = (symlink_policy or SYMLINK_POLICY) == 'follow'
+    visited = set()
+    visited_lock = threading.Lock()
+    if follow_symlinks:
+        root_stat = os.stat(dir_path)
+        visited.add((root_stat.st_dev, root_stat.st_ino))
+
+    # Walk the top level here, then hand each first-level subtree to a thread
+    totals, subdirs = _scan_subtree(dir_path, follow_symlinks, visited, visited_lock, split_top=True)
+    if not subdirs:
+        return totals
+
+    def walk(subdir):
+        return _scan_subtree(subdir, follow_symlinks, visited, visited_lock)[0]
+
+    if threads > 1 and len(subdirs) > 1:
+        with ThreadPoolExecutor(max_workers=min(threads, len(subdirs))) as executor:
+            results = list(executor.map(walk, subdirs))
     else:
-        # Check returned value for type. Success returns string. Failure returns list
-        return target_list
+        results = [walk(d) for d in subdirs]
+
+    for r in results:
+        totals['size'] += r['size']
+        totals['files'] += r['files']
+        totals['max_mtime'] = max(totals['max_mtime'], r['max_mtime'])
+        totals['linked'] += r['linked']
+    return totals
 #############################################################################################################
 
 
 #############################################################################################################
-def list_files_from_rar2(archive_path):
-    file_list = []
-    rar_cmd = '/usr/local/bin/7z l'
-    grep_regex = '\'[0-9]{4}-[0-9]{2}-[0-9]{2} [0-9]{2}:[0-9]{2}:[0-9]{2} +..... +[0-9]+ +[0-9]+ +.+$\''
-    grep_cmd = f'grep -Eo {grep_regex}'
-    awk_switch = '\'{for (i=6; i<=NF; i++) printf $i " "; print ""}\''
-    awk_switch = '\'{print $6}\''
+def scan_source_entries(source_dir):
+    # Stream (name, type) pairs for the source directory. Types come from the entries' cached d_type, so
+    # most objects are classified without a stat call
+    print_string('{:<28}{:<60}'.format('Action:', 'Fetching source filesystem objects'))
+    try:
+        entries = os.scandir(source_dir)
+    except OSError as e:
+        print_string(f'Error reading source filesystem:\t {str(e)}')
+        return
+
+    with entries:
+        for entry in entries:
+            if entry.name.endswith('.DS_Store'):
+                continue
+            try:
+                if entry.is_symlink():
+                    yield entry.name, 'symlink'
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry.name, 'file'
+                elif entry.is_dir(follow_symlinks=False):
+                    yield entry.name, 'directory'
+            except OSError:
+                continue
+#############################################################################################################
 
-    objects = os.listdir(archive_path)
-    rar_filename = [o for o in objects if o.endswith('.rar')]
 
-    if not rar_filename:
-        return None
+#############################################################################################################
+def get_fs_objects(source_dir):
+    return [name for name, _ in scan_source_entries(source_dir)]
+#############################################################################################################
 
-    # Extract uncompressed filename(s) using 7zip, excluding all the "noise"
-    rar_filename = ''.join(rar_filename)
-    rar_file_full_path = os.path.join(archive_path, rar_filename)
-    extract_cmd = f'{rar_cmd} "{rar_file_full_path}" | {grep_cmd} | awk {awk_switch}'
 
-    output = subprocess.run(
-        extract_cmd, shell=True, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+#############################################################################################################
+def parse_rate_profile(spec):
+    # 'HH:MM-HH:MM=MBPS,...' -> [(start_minute, end_minute, bytes_per_second)]. 0 means unlimited,
+    # and a window may wrap past midnight
+    profile = []
+    for window in filter(None, (w.strip() for w in spec.split(','))):
+        match = re.fullmatch(r'(\d{1,2}):(\d{2})-(\d{1,2}):(\d{2})=(\d+(?:\.\d+)?)', window)
+        if not match:
+            raise argparse.ArgumentTypeError(f'Invalid rate profile window: {window!r}')
+        start_h, start_m, end_h, end_m, mbps = match.groups()
+        profile.append((int(start_h) * 60 + int(start_m), int(end_h) * 60 + int(end_m), float(mbps) * 1000 * 1000))
+    return profile
+#############################################################################################################
+
+
+#############################################################################################################
+def configure_throttle(limit_mbps=None, profile=None, adaptive_mbps=None, busy_mbps=DEFAULT_TRANSMISSION_BUSY_MBPS):
+    _THROTTLE.update(
+        limit=limit_mbps * 1000 * 1000 if limit_mbps else None,
+        profile=profile or [],
+        adaptive=adaptive_mbps * 1000 * 1000 if adaptive_mbps else None,
+        busy_threshold=busy_mbps * 1000 * 1000,
+        next_check=0.0
     )
+    _THROTTLE['enabled'] = bool(_THROTTLE['limit'] or _THROTTLE['profile'] or _THROTTLE['adaptive'])
+#############################################################################################################
 
-    # Decode and split the output
-    output_list = output.stdout.decode('utf-8').split('\n')
 
-    # Clean results
-    # Remove any empty list values
-    output_list = list(filter(None, output_list))
+#############################################################################################################
+def transmission_is_busy():
+    # Combined download and upload rate from Transmission's session stats. Errors keep the previous state
+    try:
+        stats = get_transmission_client(TRANSMISSION_HOST, TRANSMISSION_PORT).session_stats()
+        return stats.download_speed + stats.upload_speed > _THROTTLE['busy_threshold']
+    except Exception:
+        return _THROTTLE['busy']
+#############################################################################################################
 
-    # Remove any duplicate list items
-    output_list = list(dict.fromkeys(output_list))
 
-    # Trim all leading and trailing whitespace from list items
-    output_list = [x.strip(' ') for x in output_list]
+#############################################################################################################
+def current_rate_limit(now=None):
+    # The time-of-day window wins over the flat limit; adaptive mode caps either while Transmission is busy
+    now = now or dt.datetime.now()
+    minute = now.hour * 60 + now.minute
+    rate = _THROTTLE['limit']
+    for start, end, window_rate in _THROTTLE['profile']:
+        if (start <= minute < end) if start <= end else (minute >= start or minute < end):
+            rate = window_rate or None
+            break
+    if _THROTTLE['adaptive'] and _THROTTLE['busy']:
+        rate = min(rate, _THROTTLE['adaptive']) if rate else _THROTTLE['adaptive']
+    return rate
+#############################################################################################################
 
-    # Remove "files" value from results
-    if 'files' in output_list:
-        output_list.remove('files')
 
-    if len(output_list) == 1:
-        result = ''.join(output_list)
-        if os.path.exists(os.path.join(archive_path, result)):
-            return result
-        else:
-            return {'file': result, 'result': 'missing'}
-    else:
-        # Check returned value for type. Success returns string. Failure returns list
-        return output_list
+#############################################################################################################
+def throttle(nbytes):
+    # Take nbytes from the shared bucket, sleeping off any debt. Each caller reserves its bytes under the
+    # lock and sleeps outside it, so concurrent copies share the rate fairly
+    if not _THROTTLE['enabled']:
+        return
+    with _THROTTLE['lock']:
+        now = time.monotonic()
+        if now >= _THROTTLE['next_check']:
+            if _THROTTLE['adaptive']:
+                _THROTTLE['busy'] = transmission_is_busy()
+            rate = current_rate_limit()
+            if rate != _THROTTLE['rate']:
+                _THROTTLE.update(rate=rate, tokens=rate or 0.0, stamp=now)
+            _THROTTLE['next_check'] = now + THROTTLE_CHECK_INTERVAL
+        rate = _THROTTLE['rate']
+        if not rate:
+            return
+        # Up to one second of burst
+        _THROTTLE['tokens'] = min(rate, _THROTTLE['tokens'] + (now - _THROTTLE['stamp']) * rate) - nbytes
+        _THROTTLE['stamp'] = now
+        wait = -_THROTTLE['tokens'] / rate if _THROTTLE['tokens'] < 0 else 0
+    if wait:
+        time.sleep(wait)
 #############################################################################################################
 
 
 #############################################################################################################
-def scrub_directory(obj_full_path):
-    # Get name of unpacked file
-    target_file = list_files_from_rar(obj_full_path)
+def journal_lookup(source, dest):
+    # The unfinished move of source to dest, with the files already copied, or None
+    db = cache_db()
+    with _CACHE_DB_LOCK:
+        row = db.execute('SELECT dest, staging, state FROM moves WHERE source = ?', (source,)).fetchone()
+        if not row or row[0] != dest:
+            return None
+        done = dict(db.execute('SELECT rel_path, size FROM move_files WHERE source = ?', (source,)).fetchall())
+    return {'source': source, 'dest': row[0], 'staging': row[1], 'state': row[2], 'done': done, 'resumed': True}
+#############################################################################################################
 
-    # Check if a list was returned, as this indicates multiple targets
-    # if not (isinstance(target_file, str)):
-    if isinstance(target_file, list):
-        # Check if more than 1 unpacked files exist. If so, just leave
+
+#############################################################################################################
+def journal_begin(source, dest):
+    # Recorded before any bytes are written, so an interrupted copy is found on the next run
+    staging = os.path.join(os.path.dirname(dest), f'.{os.path.basename(dest)}{STAGING_SUFFIX}')
+    db = cache_db()
+    with _CACHE_DB_LOCK:
+        db.execute('DELETE FROM move_files WHERE source = ?', (source,))
+        db.execute('INSERT OR REPLACE INTO moves VALUES (?, ?, ?, ?, ?)', (source, dest, staging, 'copying', time.time()))
+    return {'source': source, 'dest': dest, 'staging': staging, 'state': 'copying', 'done': {}, 'resumed': False}
+#############################################################################################################
+
+
+#############################################################################################################
+def journal_file_done(journal, rel_path, size):
+    with _CACHE_DB_LOCK:
+        cache_db().execute('INSERT OR REPLACE INTO move_files VALUES (?, ?, ?)', (journal['source'], rel_path, size))
+    journal['done'][rel_path] = size
+#############################################################################################################
+
+
+#############################################################################################################
+def journal_set_state(journal, state):
+    with _CACHE_DB_LOCK:
+        cache_db().execute('UPDATE moves SET state = ? WHERE source = ?', (state, journal['source']))
+    journal['state'] = state
+#############################################################################################################
+
+
+#############################################################################################################
+def journal_finish(journal):
+    db = cache_db()
+    with _CACHE_DB_LOCK:
+        db.execute('DELETE FROM move_files WHERE source = ?', (journal['source'],))
+        db.execute('DELETE FROM moves WHERE source = ?', (journal['source'],))
+#############################################################################################################
+
+
+#############################################################################################################
+def resume_journal_moves():
+    # Finish moves a previous run left behind. Copies continue from the last completed file; a copy that was
+    # already published under its real name only needs the source removed. Moves that failed are left to the
+    # failure queue's backoff
+    with _CACHE_DB_LOCK:
+        rows = cache_db().execute('SELECT source, dest, staging, state FROM moves ORDER BY started').fetchall()
+    backoff = load_failure_backoff() if rows else {}
+
+    results = []
+    for source, dest, staging, state in rows:
+        print_string('{:<26}  {:<60}'.format('Unfinished move:', source))
+        if in_backoff(backoff, source):
+            print_string('{:4}{:<24}{:<60}'.format('', 'Resume result:', 'SKIPPED, backing off'))
+            continue
+        if not os.path.lexists(source):
+            journal_finish({'source': source})
+            if os.path.lexists(dest):
+                result = 'success'
+            else:
+                # Nothing left to copy from. The partial copy is kept for inspection
+                print_string('{:4}{:<24}{:<60}'.format('', 'Resume response:', f'Source is gone, partial copy: {staging}'))
+                result = 'failed'
+        else:
+            process_object_dict = process_object(source, os.path.dirname(dest))
+            result = process_object_dict['result']
+            print_transfer_stats(process_object_dict)
+            if result != 'success':
+                print_string('{:4}{:<24}{:<60}'.format('', 'Resume response:', process_object_dict['response']))
+            if result == 'failed':
+                record_failure(source, 'directory' if os.path.isdir(source) else 'file', process_object_dict['response'])
+            elif result == 'success':
+                clear_failure(source)
+        print_string('{:4}{:<24}{:<60}'.format('', 'Resume result:', result.upper()))
+        results.append({'source': source, 'result': result})
+    return results
+#############################################################################################################
+
+
+#############################################################################################################
+def copy_kernel(fsrc, fdst, size):
+    # Let the kernel move the data: copy_file_range first, then sendfile (file to file only works on Linux).
+    # A call that copies nothing at all hands over to the next method, rather than passing for an empty file
+    if not size:
+        return 0
+    copied = 0
+    in_fd, out_fd = fsrc.fileno(), fdst.fileno()
+    chunk_size = THROTTLED_COPY_CHUNK if _THROTTLE['enabled'] else KERNEL_COPY_CHUNK
+    kernel_funcs = (getattr(os, 'copy_file_range', None), os.sendfile if sys.platform == 'linux' else None)
+    for copy_func in kernel_funcs:
+        if copy_func is None:
+            continue
+        try:
+            while copied < size:
+                chunk = min(chunk_size, size - copied)
+                throttle(chunk)
+                if copy_func is os.sendfile:
+                    sent = copy_func(out_fd, in_fd, copied, chunk)
+                else:
+                    sent = copy_func(in_fd, out_fd, chunk, copied, copied)
+                if sent == 0:
+                    break
+                copied += sent
+        except OSError as e:
+            # Only fall back if nothing has been written yet
+            if copied or e.errno not in _COPY_FALLBACK_ERRNOS:
+                raise
+        if copied:
+            return copied
+
+    return copy_buffered(fsrc, fdst, size)
+#############################################################################################################
+
+
+#############################################################################################################
+def copy_buffered(fsrc, fdst, size):
+    # Anonymous mmap gives a page-aligned buffer, reused for the whole file
+    copied = 0
+    with mmap.mmap(-1, BUFFERED_COPY_SIZE) as buffer:
+        view = memoryview(buffer)
+        try:
+            while True:
+                read = fsrc.readinto(view)
+                if not read:
+                    break
+                throttle(read)
+                fdst.write(view[:read])
+                copied += read
+        finally:
+            view.release()
+    return copied
+#############################################################################################################
+
+
+#############################################################################################################
+def copy_shutil(fsrc, fdst, size):
+    shutil.copyfileobj(fsrc, fdst, BUFFERED_COPY_SIZE)
+    return fdst.tell()
+#############################################################################################################
+
+
+#############################################################################################################
+COPY_ENGINES = {
+    'auto': copy_kernel,
+    'buffered': copy_buffered,
+    'shutil': copy_shutil
+}
+#############################################################################################################
+
+
+#############################################################################################################
+def copy_file_fast(src, dst, engine=None, sync=False):
+    copy_func = COPY_ENGINES[engine or COPY_ENGINE]
+    if copy_func is copy_shutil and _THROTTLE['enabled']:
+        # shutil.copyfileobj can't be throttled from outside
+        copy_func = copy_buffered
+    if copy_func is copy_kernel and sys.platform == 'darwin' and not _THROTTLE['enabled']:
+        # macOS has neither copy_file_range nor file to file sendfile; shutil.copyfile uses fcopyfile there
+        size = os.stat(src).st_size
+        shutil.copyfile(src, dst)
+        copied = os.stat(dst).st_size
+        if sync:
+            with open(dst, 'rb') as fdst:
+                os.fsync(fdst.fileno())
+    else:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            size = os.fstat(fsrc.fileno()).st_size
+
+            # Reserve the full extent up front, so the archive disk allocates it contiguously
+            if size and hasattr(os, 'posix_fallocate'):
+                try:
+                    os.posix_fallocate(fdst.fileno(), 0, size)
+                except OSError:
+                    pass
+
+            copied = copy_func(fsrc, fdst, size)
+            fdst.truncate(copied)
+            if sync:
+                # Journaled copies are only recorded as done once the data is on disk
+                fdst.flush()
+                os.fsync(fdst.fileno())
+    if copied != size:
+        # Never report a truncated copy as done: the caller would record it and remove the source
+        raise OSError(errno.EIO, f'Short copy: {copied} of {size} bytes', src)
+    shutil.copystat(src, dst)
+    return copied
+#############################################################################################################
+
+
+#############################################################################################################
+def copy_tree_fast(src, dst, engine=None, journal=None, links=None):
+    # Copy files, symlinks and directories, returning the number of bytes copied. With a journal, each
+    # completed file is recorded, and files recorded by an earlier attempt are skipped. Files in links
+    # are hardlinked to the given path instead of copied
+    if os.path.islink(src):
+        if not (journal and os.path.lexists(dst)):
+            os.symlink(os.readlink(src), dst)
+        return 0
+    if not os.path.isdir(src):
+        if journal is None:
+            return copy_file_fast(src, dst, engine)
+        rel_path = os.path.relpath(src, journal['source'])
+        if rel_path in journal['done'] and os.path.exists(dst) and os.path.getsize(dst) == journal['done'][rel_path]:
+            return 0
+        if links and src in links:
+            try:
+                if os.path.lexists(dst):
+                    os.unlink(dst)
+                os.link(links[src], dst)
+                journal_file_done(journal, rel_path, os.path.getsize(dst))
+                return 0
+            except OSError:
+                # EMLINK, or a filesystem without hardlinks. Copy it instead
+                pass
+        copied = copy_file_fast(src, dst, engine, sync=True)
+        journal_file_done(journal, rel_path, copied)
+        return copied
+
+    copied = 0
+    os.makedirs(dst, exist_ok=journal is not None)
+    with os.scandir(src) as entries:
+        for entry in entries:
+            copied += copy_tree_fast(entry.path, os.path.join(dst, entry.name), engine, journal, links)
+
+    # Directory times are applied last, as copying the contents would update them
+    shutil.copystat(src, dst)
+    return copied
+#############################################################################################################
+
+
+#############################################################################################################
+def move_object(obj_full_path, dest_path, engine=None, links=None):
+    # Equivalent to shutil.move(obj_full_path, dest_path), with a faster cross-device copy and transfer stats.
+    # Cross-device copies are journaled and staged under a hidden name, so an interrupted copy is resumed by
+    # the next run and never looks like a finished archive copy. Files in links are hardlinked rather than
+    # copied, which goes through the same journaled path even on one device, so the source's blocks are freed
+    real_dest = os.path.join(dest_path, os.path.basename(obj_full_path.rstrip(os.sep)))
+    journal = journal_lookup(obj_full_path, real_dest)
+    published = journal is not None and journal['state'] == 'copied'
+    if os.path.lexists(real_dest) and not published:
+        raise shutil.Error(f"Destination path '{real_dest}' already exists")
+
+    move_start = time.monotonic()
+    if journal is None and not links and os.lstat(obj_full_path).st_dev == os.stat(dest_path).st_dev:
+        # Same device, so this is just a metadata update
+        os.rename(obj_full_path, real_dest)
+        return {'method': 'rename', 'bytes': 0, 'seconds': time.monotonic() - move_start}
+
+    copied = 0
+    linked = sum(os.path.getsize(p) for p in links.values()) if links else 0
+    if not published:
+        if os.path.isdir(obj_full_path) and not os.path.islink(obj_full_path):
+            needed = scan_tree(obj_full_path)['size'] - linked
+        else:
+            needed = os.lstat(obj_full_path).st_size - linked
+        with reserve_destination_space(dest_path, needed):
+            # Journaled only once the space is reserved, so a deferred move leaves nothing to resume
+            journal = journal or journal_begin(obj_full_path, real_dest)
+            copied = copy_tree_fast(obj_full_path, journal['staging'], engine, journal, links)
+        os.rename(journal['staging'], real_dest)
+        journal_set_state(journal, 'copied')
+
+    if os.path.isdir(obj_full_path) and not os.path.islink(obj_full_path):
+        shutil.rmtree(obj_full_path)
+    else:
+        os.unlink(obj_full_path)
+    journal_finish(journal)
+    return {'method': 'copy', 'bytes': copied, 'seconds': time.monotonic() - move_start, 'resumed': journal['resumed'],
+            'linked': linked}
+#############################################################################################################
+
+
+#############################################################################################################
+def process_object(obj_full_path, dest_path, link_from=None):
+    if not dest_path.__contains__('Trash'):
+        dest_label = re.sub(r'_dir|__DEV', '', dest_path.split('/')[-1])
+    else:
+        dest_label = 'Trash'
+
+    with stage_timer('move', dest=dest_label) as record:
+        try:
+            # Objects entering the archive are signed from the source side, before the move
+            cataloged = os.path.abspath(dest_path) in CATALOG_ROOTS
+            signature = object_signature(obj_full_path) if cataloged else None
+            # A duplicate headed for the Graveyard shares its identical files with the archive copy (link_from)
+            links = graveyard_links(obj_full_path, link_from, dest_path) if link_from else None
+            with device_slot(dest_path):
+                move_dict = move_object(obj_full_path, dest_path, links=links)
+            catalog_remove(obj_full_path)
+            if cataloged:
+                catalog_add(os.path.join(dest_path, os.path.basename(obj_full_path.rstrip(os.sep))), signature)
+            response_dict = {
+                'result': 'success',
+                'response': f'Object successfully moved to {dest_label}',
+                **move_dict
+            }
+            record.update(method=move_dict['method'], bytes=move_dict['bytes'], resumed=move_dict.get('resumed', False),
+                          linked=move_dict.get('linked', 0))
+            if move_dict['method'] == 'copy' and _THROTTLE['rate']:
+                record['rate_limit'] = _THROTTLE['rate']
+        except DestinationFullError as e:
+            response_dict = {
+                'result': 'deferred',
+                'response': f'Response: {str(e)}'
+            }
+        except OSError as e:
+            response_dict = {
+                'result': 'failed',
+                'response': f'Response: {str(e)}'
+            }
+            note_failure_reason(str(e))
+        record['result'] = response_dict['result']
+    return response_dict
+#############################################################################################################
+
+
+#############################################################################################################
+def process_symlink(o):
+    try:
+        os.unlink(o)
+        # Unlinking successful
+        response_dict = {
+            'result': 'success',
+            'response': ''
+        }
+    except Exception as e:
+        # Unlinking failed
+        response_dict = {
+            'result': 'failed',
+            'response': f'Response: {str(e)}'
+        }
+        note_failure_reason(str(e))
+    return response_dict
+#############################################################################################################
+
+
+#############################################################################################################
+class DestinationFullError(OSError):
+    # Raised before a copy starts when the destination volume can't hold the object
+    pass
+#############################################################################################################
+
+
+#############################################################################################################
+def volume_usage(path):
+    st = os.statvfs(path)
+    free = st.f_bavail * st.f_frsize
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    # Percent used the way df reports it: blocks reserved for root are excluded
+    usable = used + free
+    return {'total': usable, 'free': free, 'used': used, 'percent': 100.0 * used / usable if usable else 0.0}
+#############################################################################################################
+
+
+#############################################################################################################
+@contextlib.contextmanager
+def reserve_destination_space(dest_path, needed):
+    # Claim space on the destination device for the duration of a copy, so concurrent copies can't overcommit
+    device = os.stat(dest_path).st_dev
+    with _DEVICE_SLOTS_LOCK:
+        available = volume_usage(dest_path)['free'] - _DEST_RESERVED.get(device, 0) - DEST_FREE_RESERVE
+        if needed > available:
+            raise DestinationFullError(errno.ENOSPC, f'Needs {hm.naturalsize(needed)}, '
+                                                     f'{hm.naturalsize(max(available, 0))} available', dest_path)
+        _DEST_RESERVED[device] = _DEST_RESERVED.get(device, 0) + needed
+    try:
+        yield
+    finally:
+        with _DEVICE_SLOTS_LOCK:
+            _DEST_RESERVED[device] -= needed
+#############################################################################################################
+
+
+#############################################################################################################
+def device_slot(path):
+    # Limit the number of concurrent moves targeting the same device
+    target = path if os.path.exists(path) else os.path.dirname(path)
+    try:
+        device = os.stat(target).st_dev
+    except OSError:
+        device = target
+
+    with _DEVICE_SLOTS_LOCK:
+        if device not in _DEVICE_SLOTS:
+            _DEVICE_SLOTS[device] = threading.BoundedSemaphore(DEVICE_CONCURRENCY)
+        return _DEVICE_SLOTS[device]
+#############################################################################################################
+
+
+#############################################################################################################
+@contextlib.contextmanager
+def item_log_group():
+    # Collect everything printed while processing one object, then print it in one block
+    _LOG_CONTEXT.buffer = []
+    try:
+        yield
+    finally:
+        lines = _LOG_CONTEXT.buffer
+        _LOG_CONTEXT.buffer = None
+        with _PRINT_LOCK:
+            print('\n'.join(lines))
+            sys.stdout.flush()
+#############################################################################################################
+
+
+#############################################################################################################
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Archive completed Transmission objects')
+    parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS,
+                        help='Number of objects processed in parallel (default: %(default)s, sequential)')
+    parser.add_argument('--device-concurrency', type=int, default=DEFAULT_DEVICE_CONCURRENCY,
+                        help='Maximum concurrent moves per destination device (default: %(default)s)')
+    parser.add_argument('--copy-engine', choices=sorted(COPY_ENGINES), default=DEFAULT_COPY_ENGINE,
+                        help='How cross-device moves copy file data (default: %(default)s)')
+    parser.add_argument('--no-size-cache', action='store_true',
+                        help='Always walk archive directories instead of using the size cache')
+    parser.add_argument('--size-cache', choices=['info', 'rebuild', 'prune'],
+                        help='Inspect, rebuild or prune the archive size cache, then exit')
+    parser.add_argument('--daemon', action='store_true',
+                        help='Keep running, processing source objects as they change or leave Transmission')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='Seconds between source directory scans when inotify is unavailable (default: %(default)s)')
+    parser.add_argument('--transmission-interval', type=float, default=DEFAULT_TRANSMISSION_INTERVAL,
+                        help='Seconds between Transmission polls in daemon mode (default: %(default)s)')
+    parser.add_argument('--startup-profile', action='store_true',
+                        help='Report the time spent before the first stage')
+    parser.add_argument('--run-log', metavar='PATH',
+                        help='JSON lines file for stage timings (default: run_<date>.jsonl in the log dir)')
+    parser.add_argument('--no-run-log', action='store_true', help='Do not write the JSON lines run log')
+    parser.add_argument('--compare-mode', choices=['size', 'fingerprint'], default=DEFAULT_COMPARE_MODE,
+                        help='How an existing archive copy is compared with the source (default: %(default)s)')
+    parser.add_argument('--plan', action='store_true',
+                        help='Plan every object up front, print the plan, then run it in cost-aware order')
+    parser.add_argument('--dry-run', action='store_true', help='Print the plan and estimated runtime only')
+    parser.add_argument('--copy-rate', type=float, default=DEFAULT_COPY_RATE_MBPS,
+                        help='Cross-device copy rate in MB/s used for estimates (default: %(default)s)')
+    parser.add_argument('--high-watermark', type=float, metavar='PCT',
+                        help='Only archive once the source volume is more than PCT percent full (implies --plan)')
+    parser.add_argument('--low-watermark', type=float, metavar='PCT',
+                        help=f'Archive until the source volume drops to PCT percent full '
+                             f'(default: high watermark - {DEFAULT_WATERMARK_GAP})')
+    parser.add_argument('--order', choices=['largest', 'oldest'], default=DEFAULT_WATERMARK_ORDER,
+                        help='Which objects to archive first when above the high watermark (default: %(default)s)')
+    parser.add_argument('--rate-limit', type=float, metavar='MBPS',
+                        help='Limit cross-device copies to MBPS megabytes per second, shared by all workers')
+    parser.add_argument('--rate-profile', type=parse_rate_profile, metavar='SPEC',
+                        help="Time-of-day limits, e.g. '08:00-23:00=20,23:00-08:00=0' (0 = unlimited)")
+    parser.add_argument('--adaptive-throttle', type=float, metavar='MBPS',
+                        help='Cap copies at MBPS while Transmission is actively transferring')
+    parser.add_argument('--transmission-busy', type=float, metavar='MBPS', default=DEFAULT_TRANSMISSION_BUSY_MBPS,
+                        help='Transmission transfer rate that counts as busy (default: %(default)s)')
+    parser.add_argument('--failures', choices=['list', 'clear'],
+                        help='List or clear the queue of failed objects waiting to be retried, then exit')
+    parser.add_argument('--rebuild-catalog', action='store_true',
+                        help='Re-index the archive catalog (in parallel), then exit')
+    parser.add_argument('--no-catalog', action='store_true',
+                        help='Only look for existing copies under the exact same name')
+    parser.add_argument('--no-verify-scrub', action='store_true',
+                        help='Scrub unpacked files without checking them against the CRC32 in the RAR headers')
+    parser.add_argument('--graveyard-hardlinks', action='store_true',
+                        help='Hardlink files identical to the archive copy into the Graveyard, copying only the rest')
+    parser.add_argument('--sweep-graveyard', action='store_true',
+                        help='Evict Graveyard objects over --graveyard-max-age or --graveyard-budget before archiving')
+    parser.add_argument('--sweep-only', action='store_true', help='Only sweep the Graveyard, then exit')
+    parser.add_argument('--graveyard-budget', type=float, metavar='GB',
+                        help='Keep the Graveyard under GB gigabytes, evicting confirmed duplicates first, then the oldest')
+    parser.add_argument('--graveyard-max-age', type=float, metavar='DAYS',
+                        help='Evict Graveyard objects that landed more than DAYS days ago')
+    parser.add_argument('--torrent-done', action='store_true',
+                        help="Run as Transmission's script-torrent-done: archive only the torrent in TR_TORRENT_*")
+    parser.add_argument('--remove-torrent', action='store_true',
+                        help='With --torrent-done, remove the torrent from Transmission (keeping its data) first')
+    parser.add_argument('--pipelines', metavar='CONFIG',
+                        help='Run every source/archive/Transmission pipeline in a JSON config, concurrently')
+    parser.add_argument('--profile', action='store_true',
+                        help='Profile every stage with cProfile and write one merged report next to the run log')
+    parser.add_argument('--profile-memory', action='store_true',
+                        help='Take tracemalloc snapshots around the source listing and processing')
+    parser.add_argument('--sample-profile', type=float, nargs='?', const=PROFILE_SAMPLE_INTERVAL, metavar='SECONDS',
+                        help='Sample thread stacks every SECONDS (default: %(const)s) and save the top hotspots')
+    args = parser.parse_args(argv)
+    if args.workers < 1 or args.device_concurrency < 1:
+        parser.error('--workers and --device-concurrency must be at least 1')
+    if (args.sweep_graveyard or args.sweep_only) and args.graveyard_budget is None and args.graveyard_max_age is None:
+        parser.error('--sweep-graveyard and --sweep-only need --graveyard-budget and/or --graveyard-max-age')
+    return args
+#############################################################################################################
+
+
+#############################################################################################################
+def print_env(paths_dict):
+    print_string('{:>25}{:3}{:<60}'.format('Source:', '', paths_dict['source_dir']))
+    print_string('{:>25}{:3}{:<60}'.format('Destination:', '', paths_dict['archive_dir']))
+    print_string('{:>25}{:3}{:<60}'.format('Trash:', '', paths_dict['trash_dir']))
+    print_string(f'{MARKER_CHAR * 100}')
+#############################################################################################################
+
+
+#############################################################################################################
+def print_obj_counts(counts):
+    print_string('{:>30}{:3}{:<60}'.format('Symlinks:', '', counts.get('symlink', 0)))
+    print_string('{:>30}{:3}{:<60}'.format('Files:', '', counts.get('file', 0)))
+    print_string('{:>30}{:3}{:<60}'.format('Directories:', '', counts.get('directory', 0)))
+#############################################################################################################
+
+
+#############################################################################################################
+def print_transfer_stats(process_object_dict):
+    if process_object_dict.get('method') != 'copy':
+        return
+    seconds = max(process_object_dict['seconds'], 1e-6)
+    rate = process_object_dict['bytes'] / seconds
+    print_string('{:4}{:<24}{:<60}'.format('', 'Throughput:', f"{hm.naturalsize(process_object_dict['bytes'])} in "
+                                                              f"{seconds:.1f}s ({hm.naturalsize(rate)}/s)"
+                                                              f"{', resumed' if process_object_dict.get('resumed') else ''}"))
+    if process_object_dict.get('linked'):
+        print_string('{:4}{:<24}{:<60}'.format('', 'Hardlinked:', f"{hm.naturalsize(process_object_dict['linked'])} "
+                                                                  f"shared with the archive copy"))
+    if _THROTTLE['rate']:
+        print_string('{:4}{:<24}{:<60}'.format('', 'Rate limit:', f"{hm.naturalsize(_THROTTLE['rate'])}/s"
+                                                                  f"{' (Transmission busy)' if _THROTTLE['busy'] else ''}"))
+#############################################################################################################
+
+
+#############################################################################################################
+def open_run_log(path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    _RUN_LOG['file'] = open(path, 'a', buffering=RUN_LOG_BUFFER_SIZE)
+    _RUN_LOG['path'] = path
+    atexit.register(close_run_log)
+#############################################################################################################
+
+
+#############################################################################################################
+def close_run_log():
+    with _RUN_LOG_LOCK:
+        if _RUN_LOG['file'] is not None:
+            _RUN_LOG['file'].close()
+            _RUN_LOG['file'] = None
+    sys.stdout.flush()
+#############################################################################################################
+
+
+#############################################################################################################
+def write_run_log(record):
+    with _RUN_LOG_LOCK:
+        STAGE_RECORDS.append(record)
+        if _RUN_LOG['file'] is not None:
+            _RUN_LOG['file'].write(json.dumps(record, default=str) + '\n')
+#############################################################################################################
+
+
+#############################################################################################################
+@contextlib.contextmanager
+def stage_timer(stage, **fields):
+    # Time a stage or per-object step. Callers can add fields (e.g. bytes) to the yielded record
+    record = {'run': RUN_ID, 'stage': stage, **fields}
+    item = getattr(_LOG_CONTEXT, 'item', None)
+    if item is not None and 'item' not in record:
+        record['item'] = item
+    pipeline = getattr(_LOG_CONTEXT, 'pipeline', None)
+    if pipeline is not None and 'pipeline' not in record:
+        record['pipeline'] = pipeline
+    profiler = start_stage_profile()
+    stage_start = time.perf_counter()
+    record['start'] = dt.datetime.now().isoformat()
+    try:
+        yield record
+    except BaseException as e:
+        record['error'] = repr(e)
+        raise
+    finally:
+        record['seconds'] = round(time.perf_counter() - stage_start, 6)
+        stop_stage_profile(profiler)
+        write_run_log(record)
+        if item is None:
+            sys.stdout.flush()
+#############################################################################################################
+
+
+#############################################################################################################
+def start_profiling(cprofile=False, memory=False, sample_interval=None):
+    _PROFILE['enabled'] = cprofile
+    if memory:
+        import tracemalloc
+        tracemalloc.start(10)
+        _PROFILE['memory'] = True
+    if sample_interval:
+        stop_event = threading.Event()
+        sampler = threading.Thread(target=_sample_stacks, args=(sample_interval, stop_event),
+                                   name='stack-sampler', daemon=True)
+        _PROFILE['sampler'] = (sampler, stop_event)
+        sampler.start()
+    atexit.register(finish_profiling)
+#############################################################################################################
+
+
+#############################################################################################################
+def start_stage_profile():
+    # Only the outermost stage on a thread is profiled; nested steps are already inside its profile
+    if not _PROFILE['enabled'] or getattr(_LOG_CONTEXT, 'profiling', False):
+        return None
+    import cProfile
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # Another profiler is active (interpreter wide on newer Pythons)
+        return None
+    _LOG_CONTEXT.profiling = True
+    return profiler
+#############################################################################################################
+
+
+#############################################################################################################
+def stop_stage_profile(profiler):
+    if profiler is None:
+        return
+    profiler.disable()
+    _LOG_CONTEXT.profiling = False
+    import pstats
+    with _PROFILE['lock']:
+        if _PROFILE['stats'] is None:
+            _PROFILE['stats'] = pstats.Stats(profiler)
+        else:
+            _PROFILE['stats'].add(profiler)
+#############################################################################################################
+
+
+#############################################################################################################
+def memory_checkpoint(label):
+    # tracemalloc snapshot, compared with the previous one in the report
+    if not _PROFILE['memory']:
+        return
+    import tracemalloc
+    current, peak = tracemalloc.get_traced_memory()
+    _PROFILE['snapshots'].append((label, tracemalloc.take_snapshot(), current, peak))
+    write_run_log({'run': RUN_ID, 'stage': 'memory', 'label': label, 'current': current, 'peak': peak, 'seconds': 0})
+#############################################################################################################
+
+
+#############################################################################################################
+def _sample_stacks(interval, stop_event):
+    # Count the innermost frame (self) and every function on the stack (inclusive) of each other thread
+    own_id = threading.get_ident()
+    while not stop_event.wait(interval):
+        frames = sys._current_frames()
+        with _PROFILE['lock']:
+            for thread_id, frame in frames.items():
+                if thread_id == own_id:
+                    continue
+                _PROFILE['samples'] += 1
+                code = frame.f_code
+                key = f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})'
+                _PROFILE['self'][key] = _PROFILE['self'].get(key, 0) + 1
+                seen = set()
+                while frame is not None:
+                    code = frame.f_code
+                    key = f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})'
+                    if key not in seen:
+                        seen.add(key)
+                        _PROFILE['inclusive'][key] = _PROFILE['inclusive'].get(key, 0) + 1
+                    frame = frame.f_back
+        del frames
+#############################################################################################################
+
+
+#############################################################################################################
+def finish_profiling():
+    # Write the reports next to the run log. Safe to call more than once
+    if _PROFILE['sampler'] is not None:
+        sampler, stop_event = _PROFILE['sampler']
+        stop_event.set()
+        sampler.join()
+        _PROFILE['sampler'] = None
+    if _PROFILE['stats'] is None and not _PROFILE['samples'] and not _PROFILE['snapshots']:
+        return
+
+    report_dir = os.path.dirname(_RUN_LOG['path']) if _RUN_LOG['path'] else LOG_DIR
+    os.makedirs(report_dir, exist_ok=True)
+    stamp = RUN_ID.replace(':', '-')
+
+    if _PROFILE['stats'] is not None or _PROFILE['snapshots']:
+        report_path = os.path.join(report_dir, f'profile_{stamp}.txt')
+        with open(report_path, 'w') as f:
+            if _PROFILE['stats'] is not None:
+                _PROFILE['stats'].dump_stats(os.path.join(report_dir, f'profile_{stamp}.prof'))
+                _PROFILE['stats'].stream = f
+                _PROFILE['stats'].sort_stats('cumulative').print_stats(PROFILE_TOP)
+                _PROFILE['stats'].sort_stats('tottime').print_stats(PROFILE_TOP)
+            for (label_before, before, _, _), (label, after, current, peak) in zip(_PROFILE['snapshots'],
+                                                                                 _PROFILE['snapshots'][1:]):
+                f.write(f'Memory {label_before} -> {label}: current {current} bytes, peak {peak} bytes\n')
+                for diff in after.compare_to(before, 'lineno')[:PROFILE_TOP]:
+                    f.write(f'    {diff}\n')
+        _PROFILE['stats'] = None
+        _PROFILE['snapshots'] = []
+        print_string('{:<28}{:<60}'.format('Profile report:', report_path))
+
+    if _PROFILE['samples']:
+        hotspots_path = os.path.join(report_dir, f'hotspots_{stamp}.json')
+        with _PROFILE['lock']:
+            samples = _PROFILE['samples']
+            hotspots = {
+                'run': RUN_ID,
+                'samples': samples,
+                'self': [{'function': k, 'samples': v, 'percent': round(100 * v / samples, 2)}
+                         for k, v in sorted(_PROFILE['self'].items(), key=lambda kv: -kv[1])[:PROFILE_TOP]],
+                'inclusive': [{'function': k, 'samples': v, 'percent': round(100 * v / samples, 2)}
+                              for k, v in sorted(_PROFILE['inclusive'].items(), key=lambda kv: -kv[1])[:PROFILE_TOP]]
+            }
+            _PROFILE['samples'] = 0
+        with open(hotspots_path, 'w') as f:
+            json.dump(hotspots, f, indent=2)
+        print_string('{:<28}{:<60}'.format('Hotspots:', hotspots_path))
+        for hotspot in hotspots['self'][:5]:
+            print_string('{:4}{:>7}%  {:<60}'.format('', hotspot['percent'], hotspot['function']))
+#############################################################################################################
+
+
+#############################################################################################################
+def print_stage_summary():
+    # Totals per stage, from the records of this run
+    with _RUN_LOG_LOCK:
+        records = list(STAGE_RECORDS)
+    if not records:
+        return
+
+    summary = {}
+    for r in records:
+        totals = summary.setdefault(r['stage'], {'count': 0, 'seconds': 0.0, 'bytes': 0})
+        totals['count'] += 1
+        totals['seconds'] += r['seconds']
+        totals['bytes'] += r.get('bytes') or 0
+
+    print_string('{:<28}{:<60}'.format('Stage timings:', ''))
+    print_string('{:4}{:<24}{:>8}{:>14}{:>14}'.format('', 'Stage', 'Count', 'Seconds', 'Bytes'))
+    for stage, totals in summary.items():
+        print_string('{:4}{:<24}{:>8}{:>14.3f}{:>14}'.format('', stage, totals['count'], totals['seconds'],
+                                                                 hm.naturalsize(totals['bytes']) if totals['bytes'] else '-'))
+    if _RUN_LOG['path']:
+        print_string('{:<28}{:<60}'.format('Run log:', _RUN_LOG['path']))
+#############################################################################################################
+
+
+#############################################################################################################
+def print_string(data):
+    line = '{:<27}\t {:<}'.format(str(dt.datetime.now()), data)
+
+    # Workers buffer their lines, so each object's output is printed as one group
+    buffer = getattr(_LOG_CONTEXT, 'buffer', None)
+    if buffer is not None:
+        buffer.append(line)
+        return
+
+    # Output is flushed per object and per stage, not per line
+    with _PRINT_LOCK:
+        print(line)
+#############################################################################################################
+
+
+#############################################################################################################
+def find_rar_volume_sets(archive_path):
+    # Group the RAR files in a directory into volume sets, each ordered from the first volume to the last
+    new_style = {}
+    old_style = {}
+    for name in os.listdir(archive_path):
+        match = RAR_VOLUME_NEW.match(name)
+        if match:
+            new_style.setdefault(match['base'], []).append((int(match['num']), name))
+            continue
+        match = RAR_VOLUME_OLD.match(name)
+        if match:
+            ext = match['ext'].lower()
+            # name.rar comes first, then .r00-.r99, .s00-.s99, ...
+            order = -1 if ext == 'rar' else (ord(ext[0]) - ord('r')) * 100 + int(ext[1:])
+            old_style.setdefault(match['base'], []).append((order, name))
+
+    volume_sets = [[os.path.join(archive_path, n) for _, n in sorted(v)] for v in new_style.values()]
+    volume_sets += [[os.path.join(archive_path, n) for _, n in sorted(v)]
+                    for v in old_style.values() if min(v)[0] == -1]
+    return volume_sets
+#############################################################################################################
+
+
+#############################################################################################################
+def _read_vint(buf, pos):
+    # RAR5 variable length integer: 7 bits per byte, lowest bits first
+    value = 0
+    shift = 0
+    while True:
+        byte = buf[pos]
+        pos += 1
+        value |= (byte & 0x7f) << shift
+        if not byte & 0x80:
+            return value, pos
+        shift += 7
+        if shift > 63:
+            raise ValueError('Invalid RAR5 integer')
+#############################################################################################################
+
+
+#############################################################################################################
+def _decode_rar4_name(name_bytes, unicode_name):
+    if not unicode_name or b'\0' not in name_bytes:
+        try:
+            return name_bytes.decode('utf-8')
+        except UnicodeDecodeError:
+            return name_bytes.decode('latin-1')
+
+    # Unicode names are stored as a plain name, a NUL, then a compressed UTF-16 delta against the plain name.
+    # The delta yields UTF-16 code units, so characters outside the BMP arrive as surrogate pairs
+    null = name_bytes.index(b'\0')
+    encoded = name_bytes[null + 1:]
+    try:
+        high = encoded[0]
+        enc_pos = 1
+        flags = flag_bits = 0
+        units = []
+        while enc_pos < len(encoded):
+            if flag_bits == 0:
+                flags = encoded[enc_pos]
+                enc_pos += 1
+                flag_bits = 8
+            flag_bits -= 2
+            mode = (flags >> flag_bits) & 3
+            if mode == 0:
+                units.append(encoded[enc_pos])
+                enc_pos += 1
+            elif mode == 1:
+                units.append(encoded[enc_pos] + (high << 8))
+                enc_pos += 1
+            elif mode == 2:
+                units.append(encoded[enc_pos] | (encoded[enc_pos + 1] << 8))
+                enc_pos += 2
+            else:
+                length = encoded[enc_pos]
+                enc_pos += 1
+                if length & 0x80:
+                    correction = encoded[enc_pos]
+                    enc_pos += 1
+                    for _ in range((length & 0x7f) + 2):
+                        units.append(((name_bytes[len(units)] + correction) & 0xff) + (high << 8))
+                else:
+                    for _ in range(length + 2):
+                        units.append(name_bytes[len(units)])
+        return struct.pack(f'<{len(units)}H', *units).decode('utf-16-le', 'surrogatepass')
+    except IndexError:
+        return name_bytes[:null].decode('latin-1')
+#############################################################################################################
+
+
+#############################################################################################################
+def _read_rar4_headers(buf, pos):
+    entries = []
+    while pos + 7 <= len(buf):
+        head_crc, head_type, head_flags, head_size = struct.unpack_from('<HBHH', buf, pos)
+        if head_size < 7 or pos + head_size > len(buf):
+            raise ValueError('Truncated RAR4 header')
+        if zlib.crc32(buf[pos + 2:pos + head_size]) & 0xffff != head_crc:
+            raise ValueError('RAR4 header CRC mismatch')
+
+        add_size = 0
+        if head_type == 0x73 and head_flags & 0x0080:
+            raise ValueError('RAR4 headers are encrypted')
+        elif head_type == 0x74:
+            pack_size, unp_size, _, file_crc, _, _, _, name_size, _ = struct.unpack_from('<IIBIIBBHI', buf, pos + 7)
+            name_pos = pos + 32
+            if head_flags & 0x0100:
+                high_pack, high_unp = struct.unpack_from('<II', buf, pos + 32)
+                pack_size |= high_pack << 32
+                unp_size |= high_unp << 32
+                name_pos += 8
+            name = _decode_rar4_name(bytes(buf[name_pos:name_pos + name_size]), head_flags & 0x0200)
+            entries.append({
+                'name': name.replace('\\', '/'),
+                'size': unp_size,
+                'crc': file_crc,
+                'is_dir': head_flags & 0x00e0 == 0x00e0,
+                'split_before': bool(head_flags & 0x0001),
+                'split_after': bool(head_flags & 0x0002)
+            })
+            add_size = pack_size
+        elif head_type == 0x7b:
+            break
+        elif head_flags & 0x8000:
+            add_size = struct.unpack_from('<I', buf, pos + 7)[0]
+        pos += head_size + add_size
+    return entries
+#############################################################################################################
+
+
+#############################################################################################################
+def _read_rar5_headers(buf, pos):
+    entries = []
+    while pos + 5 <= len(buf):
+        head_crc = struct.unpack_from('<I', buf, pos)[0]
+        head_size, body_pos = _read_vint(buf, pos + 4)
+        end_pos = body_pos + head_size
+        if end_pos > len(buf):
+            raise ValueError('Truncated RAR5 header')
+        if zlib.crc32(buf[pos + 4:end_pos]) != head_crc:
+            raise ValueError('RAR5 header CRC mismatch')
+
+        head_type, p = _read_vint(buf, body_pos)
+        head_flags, p = _read_vint(buf, p)
+        data_size = 0
+        if head_flags & 0x0001:
+            _, p = _read_vint(buf, p)
+        if head_flags & 0x0002:
+            data_size, p = _read_vint(buf, p)
+
+        if head_type == 4:
+            raise ValueError('RAR5 headers are encrypted')
+        elif head_type == 2:
+            file_flags, p = _read_vint(buf, p)
+            unp_size, p = _read_vint(buf, p)
+            _, p = _read_vint(buf, p)
+            if file_flags & 0x0002:
+                p += 4
+            file_crc = None
+            if file_flags & 0x0004:
+                file_crc = struct.unpack_from('<I', buf, p)[0]
+                p += 4
+            _, p = _read_vint(buf, p)
+            _, p = _read_vint(buf, p)
+            name_size, p = _read_vint(buf, p)
+            entries.append({
+                'name': bytes(buf[p:p + name_size]).decode('utf-8', errors='replace'),
+                'size': unp_size,
+                'crc': file_crc,
+                'is_dir': bool(file_flags & 0x0001),
+                'split_before': bool(head_flags & 0x0008),
+                'split_after': bool(head_flags & 0x0010)
+            })
+        elif head_type == 5:
+            break
+        pos = end_pos + data_size
+    return entries
+#############################################################################################################
+
+
+#############################################################################################################
+def read_rar_headers(volume_path):
+    # Read the file entries of one RAR4/RAR5 volume. Only the header pages of the mapping are touched
+    with open(volume_path, 'rb') as f:
+        if not os.fstat(f.fileno()).st_size:
+            raise ValueError('Empty RAR volume')
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            head = mm[:RAR_SIGNATURE_SEARCH]
+            rar5_pos = head.find(RAR5_SIGNATURE)
+            rar4_pos = head.find(RAR4_SIGNATURE)
+            if rar5_pos >= 0 and (rar4_pos < 0 or rar5_pos <= rar4_pos):
+                return _read_rar5_headers(mm, rar5_pos + len(RAR5_SIGNATURE))
+            if rar4_pos >= 0:
+                return _read_rar4_headers(mm, rar4_pos + len(RAR4_SIGNATURE))
+            raise ValueError('Not a RAR archive')
+#############################################################################################################
+
+
+#############################################################################################################
+def read_rar_entries(volumes):
+    # Merge the entries of a volume set. The CRC of a split file is the one stored in its last part
+    entries = {}
+    for volume_path in volumes:
+        for entry in read_rar_headers(volume_path):
+            merged = entries.setdefault(entry['name'], dict(entry))
+            if not entry['split_after']:
+                merged['crc'] = entry['crc']
+            merged['split_after'] = entry['split_after']
+    return list(entries.values())
+#############################################################################################################
+
+
+#############################################################################################################
+def _list_rar_entries_7z(volumes):
+    # Fallback for archives the header reader can't parse (e.g. encrypted headers)
+    output = subprocess.run(
+        [SEVEN_ZIP_PATH, 'l', '-slt', '-ba', volumes[0]], check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+    entries = []
+    for block in output.stdout.decode('utf-8', errors='replace').split('\n\n'):
+        fields = dict(line.split(' = ', 1) for line in block.splitlines() if ' = ' in line)
+        if 'Path' in fields:
+            entries.append({
+                'name': fields['Path'],
+                'size': int(fields.get('Size') or 0),
+                'crc': int(fields['CRC'], 16) if fields.get('CRC') else None,
+                'is_dir': fields.get('Folder') == '+',
+                'split_before': False,
+                'split_after': False
+            })
+    return entries
+#############################################################################################################
+
+
+#############################################################################################################
+def list_rar_entries(archive_path):
+    # Returns the file entries of every RAR set in a directory, or None if there are no RAR files
+    volume_sets = find_rar_volume_sets(archive_path)
+    if not volume_sets:
+        return None
+
+    entries = []
+    for volumes in volume_sets:
+        try:
+            entries += read_rar_entries(volumes)
+        except (OSError, ValueError, struct.error, IndexError):
+            if not os.path.exists(SEVEN_ZIP_PATH):
+                raise
+            entries += _list_rar_entries_7z(volumes)
+    return [e for e in entries if not e['is_dir']]
+#############################################################################################################
+
+
+#############################################################################################################
+def unpacked_rar_entries(archive_path, entries):
+    # Archive entries whose unpacked copy is sitting next to the RAR set
+    return [e for e in entries
+            if pathlib.PurePosixPath(e['name']).suffix != '.rar'
+            and pathlib.Path(archive_path, e['name']).is_file()]
+#############################################################################################################
+
+
+#############################################################################################################
+def list_files_from_rar(archive_path):
+    entries = list_rar_entries(archive_path)
+    if entries is None:
+        return None
+
+    target_list = [e['name'] for e in unpacked_rar_entries(archive_path, entries)]
+
+    if len(target_list) == 1:
+        return ''.join(target_list)
+    elif not target_list:
+        # Nothing was unpacked (or it was already scrubbed)
+        return {'file': entries[0]['name'] if len(entries) == 1 else '', 'result': 'missing'}
+    else:
+        # Check returned value for type. Success returns string. Failure returns list
+        return target_list
+#############################################################################################################
+
+
+#############################################################################################################
+def crc32_file(path, st=None):
+    # Sequential CRC32 over a read-only mapping, in large chunks (zlib releases the GIL while it hashes them).
+    # Cached per (path, size, mtime)
+    st = st or os.stat(path)
+    db = cache_db()
+    with _CACHE_DB_LOCK:
+        row = db.execute('SELECT size, mtime_ns, crc FROM crc32s WHERE path = ?', (path,)).fetchone()
+    if row and row[0] == st.st_size and row[1] == st.st_mtime_ns:
+        return row[2]
+
+    crc = 0
+    if st.st_size:
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, 'madvise') and hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mapped)
+            try:
+                for offset in range(0, st.st_size, CRC_CHUNK):
+                    crc = zlib.crc32(view[offset:offset + CRC_CHUNK], crc)
+            finally:
+                view.release()
+
+    with _CACHE_DB_LOCK:
+        db.execute('INSERT OR REPLACE INTO crc32s VALUES (?, ?, ?, ?)', (path, st.st_size, st.st_mtime_ns, crc))
+    return crc
+#############################################################################################################
+
+
+#############################################################################################################
+def verify_unpacked_files(archive_path, entries):
+    # Check each unpacked file against its archive entry, one thread per file. Returns {name: problem or None}.
+    # A split entry without its last part, or without a CRC, can't be verified
+    def verify(entry):
+        file_path = os.path.join(archive_path, entry['name'])
+        if entry['crc'] is None or entry['split_after']:
+            return 'No CRC recorded in the RAR set'
+        st = os.stat(file_path)
+        if st.st_size != entry['size']:
+            return f"Size mismatch: {st.st_size} on disk, {entry['size']} in the RAR set"
+        if crc32_file(file_path, st) != entry['crc']:
+            return 'CRC mismatch with the RAR set'
+        return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(CRC_THREADS, len(entries)))) as executor:
+        return dict(zip([e['name'] for e in entries], executor.map(verify, entries)))
+#############################################################################################################
+
+
+#############################################################################################################
+def scrub_directory(obj_full_path):
+    # Get name of unpacked file
+    try:
+        entries = list_rar_entries(obj_full_path)
+    except (OSError, ValueError, struct.error, IndexError, subprocess.CalledProcessError) as e:
+        scrubber_result_dict = {
+            'scrub_file': '',
+            'result': 'failed',
+            'response': f'Unable to read rar headers: {str(e)}'
+        }
+        return scrubber_result_dict
+
+    # Check if a NoneType was returned
+    if isinstance(entries, NoneType):
+        scrubber_result_dict = {
+            'scrub_file': '',
+            'result': 'success',
+            'response': 'No rar file found. Continue ...'
+        }
+        return scrubber_result_dict
+
+    targets = unpacked_rar_entries(obj_full_path, entries)
+    if not targets:
+        # Nothing was unpacked (or it was already scrubbed)
+        scrubber_result_dict = {
+            'scrub_file': entries[0]['name'] if len(entries) == 1 else '',
+            'result': 'success',
+            'response': 'Unpacked file missing. Continue ...'
+        }
+        return scrubber_result_dict
+
+    # Check if more than 1 unpacked files exist. Without verification, just leave
+    if len(targets) > 1 and not VERIFY_SCRUB:
         scrubber_result_dict = {
-            'scrub_file': target_file,
+            'scrub_file': [e['name'] for e in targets],
             'result': 'warning',
             'response': 'Found more than one video file. Skipping ...'
         }
         return scrubber_result_dict
 
-    # Check if a dict was returned
-    if isinstance(target_file, dict):
-        scrubber_result_dict = {
-            'scrub_file': target_file['file'],
-            'result': 'success',
-            'response': 'Unpacked file missing. Continue ...'
-        }
-        return scrubber_result_dict
+    if VERIFY_SCRUB:
+        # Only delete what the RAR set can restore
+        with stage_timer('verify', files=len(targets), bytes=sum(e['size'] for e in targets)) as record:
+            try:
+                problems = verify_unpacked_files(obj_full_path, targets)
+            except OSError as e:
+                problems = {targets[0]['name']: str(e)}
+            record['result'] = 'failed' if any(problems.values()) else 'success'
+        for name, problem in problems.items():
+            print_string('{:4}{:<24}{:<60}'.format('', 'CRC check:', f"{name}: {problem or 'OK'}"))
+        if any(problems.values()):
+            scrubber_result_dict = {
+                'scrub_file': [e['name'] for e in targets],
+                'result': 'warning',
+                'response': 'Unpacked file(s) not verified against the RAR set. Skipping ...'
+            }
+            return scrubber_result_dict
+
+    scrubbed = []
+    for target in targets:
+        target_file = target['name']
+        print_string('{:4}{:<24}{:<60}'.format('', 'File to scrub:', target_file))
+        target_file_full_path = os.path.join(obj_full_path, target_file)
+        try:
+            os.remove(target_file_full_path)
+            scrubbed.append(target_file)
+
+        # File deletion failed
+        except Exception as e:
+            if str(e).startswith('[Errno 2] No such file or directory'):
+                print_string('{:4}{:<24}{:<60}'.format('', 'Scrub file msg:', str(e)))
+                scrubber_result_dict = {
+                    'scrub_file': target_file,
+                    'result': 'missing',
+                    'response': 'File not found'
+                }
+                return scrubber_result_dict
+            else:
+                scrubber_result_dict = {
+                    'scrub_file': target_file,
+                    'result': 'failed',
+                    'response': f'Response: {str(e)}'
+                }
+                return scrubber_result_dict
+
+    scrubber_result_dict = {
+        'scrub_file': scrubbed[0] if len(scrubbed) == 1 else scrubbed,
+        'result': 'success',
+        'response': f"Scrubbed {', '.join(scrubbed)}"
+    }
+    return scrubber_result_dict
+#############################################################################################################
+
+
+#############################################################################################################
+def note_failure_reason(reason):
+    # The first failure reported while processing an object is kept as its reason
+    if getattr(_LOG_CONTEXT, 'reason', None) is None:
+        _LOG_CONTEXT.reason = reason
+#############################################################################################################
+
+
+#############################################################################################################
+def record_failure(obj_full_path, obj_dtype, reason):
+    try:
+        mtime_ns = os.lstat(obj_full_path).st_mtime_ns
+    except OSError:
+        mtime_ns = None
+    db = cache_db()
+    with _CACHE_DB_LOCK:
+        row = db.execute('SELECT attempts FROM failures WHERE path = ?', (obj_full_path,)).fetchone()
+        attempts = (row[0] if row else 0) + 1
+        backoff = min(FAILURE_BACKOFF_BASE * 2 ** (attempts - 1), FAILURE_BACKOFF_MAX)
+        now = time.time()
+        db.execute('INSERT OR REPLACE INTO failures VALUES (?, ?, ?, ?, ?, ?, ?)',
+                   (obj_full_path, obj_dtype, reason, attempts, mtime_ns, now, now + backoff))
+    return attempts, backoff
+#############################################################################################################
+
+
+#############################################################################################################
+def clear_failure(obj_full_path):
+    with _CACHE_DB_LOCK:
+        cache_db().execute('DELETE FROM failures WHERE path = ?', (obj_full_path,))
+#############################################################################################################
+
+
+#############################################################################################################
+def load_failure_backoff():
+    # {path: (next_eligible, mtime_ns)} for the objects still backing off. Read once per cycle
+    with _CACHE_DB_LOCK:
+        rows = cache_db().execute('SELECT path, next_eligible, mtime_ns FROM failures WHERE next_eligible > ?',
+                                  (time.time(),)).fetchall()
+    return {path: (next_eligible, mtime_ns) for path, next_eligible, mtime_ns in rows}
+#############################################################################################################
+
+
+#############################################################################################################
+def in_backoff(backoff, obj_full_path):
+    # Only objects in the queue are stat'ed; a changed object is retried straight away
+    if obj_full_path not in backoff:
+        return False
+    try:
+        return os.lstat(obj_full_path).st_mtime_ns == backoff[obj_full_path][1]
+    except OSError:
+        return False
+#############################################################################################################
+
+
+#############################################################################################################
+def skip_backoff(work_items, source_dir, backoff, skipped):
+    # Drop (name, type) pairs still backing off, collecting their names in skipped
+    for item in work_items:
+        if in_backoff(backoff, os.path.join(source_dir, item[0])):
+            skipped.append(item[0])
+        else:
+            yield item
+#############################################################################################################
+
+
+#############################################################################################################
+def run_failures_command(command):
+    db = cache_db()
+    print_string('{:<28}{:<60}'.format('Action:', f'Failure queue {command}'))
+    if command == 'clear':
+        with _CACHE_DB_LOCK:
+            removed = db.execute('DELETE FROM failures').rowcount
+        print_string('{:<28}{:<60}'.format('Cleared entries:', removed))
+        return
+
+    with _CACHE_DB_LOCK:
+        rows = db.execute('SELECT path, type, reason, attempts, next_eligible FROM failures '
+                          'ORDER BY next_eligible').fetchall()
+    print_string('{:<28}{:<60}'.format('Queued failures:', len(rows)))
+    for path, obj_dtype, reason, attempts, next_eligible in rows:
+        wait_seconds = next_eligible - time.time()
+        retry = f'in {hm.precisedelta(dt.timedelta(seconds=int(wait_seconds)))}' if wait_seconds > 0 else 'next run'
+        print_string('{:4}{:>10}:{:4}{:<60}'.format('', obj_dtype.title(), '', path))
+        print_string('{:18}{:<24}{:<60}'.format('', 'Reason:', reason or 'unknown'))
+        print_string('{:18}{:<24}{:<60}'.format('', 'Attempts:', f'{attempts}, retry {retry}'))
+#############################################################################################################
 
-    # Check if a NoneType was returned
-    if isinstance(target_file, NoneType):
-        scrubber_result_dict = {
-            'scrub_file': '',
-            'result': 'success',
-            'response': 'No rar file found. Continue ...'
-        }
-        return scrubber_result_dict
 
-    print_string('{:4}{:<24}{:<60}'.format('', 'File to scrub:', target_file))
-    # target_file_full_path = os.path.join(f'"{obj_full_path}"', f'"{target_file}"')
-    target_file_full_path = os.path.join(obj_full_path, target_file)
+#############################################################################################################
+def process_action_item(paths_dict, a, obj_dtype, counter, num_count):
+    # Process a single object. Returns the failed item entry, or None on success. An unexpected error fails
+    # just this object, however many workers there are
+    _LOG_CONTEXT.item = a
+    _LOG_CONTEXT.reason = None
+    obj_full_path = os.path.join(paths_dict['source_dir'], a)
     try:
-        os.remove(target_file_full_path)
-        scrubber_result_dict = {
-            'scrub_file': target_file,
-            'result': 'success',
-            'response': f'Scrubbed {target_file}'
-        }
-        return scrubber_result_dict
+        with stage_timer('object', type=obj_dtype) as record:
+            try:
+                failed_item = _process_action_item(paths_dict, a, obj_dtype, counter, num_count)
+            except Exception as e:
+                print_string('{:4}{:<24}{:<60}'.format('', 'Processing error:', str(e)))
+                note_failure_reason(str(e))
+                failed_item = [obj_dtype, a]
+            record['result'] = 'failed' if failed_item else 'success'
+        if failed_item:
+            attempts, backoff = record_failure(obj_full_path, obj_dtype, _LOG_CONTEXT.reason)
+            print_string('{:4}{:<24}{:<60}'.format('', 'Retry:', f'Attempt {attempts} failed, next try in '
+                                                   f'{hm.precisedelta(dt.timedelta(seconds=backoff))}'))
+        else:
+            clear_failure(obj_full_path)
+    finally:
+        _LOG_CONTEXT.item = None
+        _LOG_CONTEXT.reason = None
+        if getattr(_LOG_CONTEXT, 'buffer', None) is None:
+            sys.stdout.flush()
+    return failed_item
+#############################################################################################################
 
-    # File deletion failed
-    except Exception as e:
-        if str(e).startswith('[Errno 2] No such file or directory'):
-            print_string('{:4}{:<24}{:<60}'.format('', 'Scrub file msg:', str(e)))
-            scrubber_result_dict = {
-                'scrub_file': target_file,
-                'result': 'missing',
-                'response': 'File not found'
-            }
-            return scrubber_result_dict
+
+#############################################################################################################
+def _process_action_item(paths_dict, a, obj_dtype, counter, num_count):
+    failed_item = None
+
+    # Iteration separation
+    print_string(f'{MARKER_CHAR * 100}')
+    iter_start = dt.datetime.now()
+    obj_full_path = os.path.join(paths_dict['source_dir'], a)
+
+    object_label = f'Object ({counter} / {num_count}):' if num_count else f'Object ({counter}):'
+    if getattr(_LOG_CONTEXT, 'pipeline', None):
+        object_label = f'[{_LOG_CONTEXT.pipeline}] {object_label}'
+    print_string('{:<12}{:<60}'.format(f'{object_label}\t ', a))
+    print_string(f'{MARKER_CHAR * 100}')
+    print_string('{:4}{:<24}{:<60}'.format('', 'Object data type:', obj_dtype.upper()))
+
+    # List 'symlinks'
+    ####################################################################################################################
+    if obj_dtype == 'symlink':
+        print_string('{:4}{:<24}{:<60}'.format('', 'Next stage:', 'Unlinking'))
+
+        response_dict = process_symlink(obj_full_path)
+        print_string('{:4}{:<24}{:<60}'.format('', 'Unlinking result:', response_dict['result'].upper()))
+        if response_dict['result'] != 'success':
+            print_string('{:4}{:<24}{:<60}'.format('', 'Unlinking response:', response_dict['response']))
+            failed_item = [obj_dtype, a]
+
+    # List 'files'
+    ####################################################################################################################
+    elif obj_dtype == 'file':
+        print_string('{:4}{:<24}{:<60}'.format('', 'Next stage:', 'Check if object exists in archive'))
+
+        # Check if there is already a version in target archive
+        process_result = instance_check(paths_dict, obj_full_path)
+        if process_result == 'failed':
+            failed_item = [obj_dtype, a]
+        elif process_result == 'deferred':
+            DEFERRED_ITEMS.append([obj_dtype, a])
+
+    # List 'directories'
+    ####################################################################################################################
+    elif obj_dtype == 'directory':
+        # If rar file in dir, scrub unpacked file
+        with stage_timer('scrub') as record:
+            process_dir_dict = has_rar(obj_full_path)
+            record['result'] = process_dir_dict['result'] or 'no_rar'
+
+        if not process_dir_dict['continue']:
+            print_string('{:4}{:<24}{:<60}'.format('', 'Scrubbing result:', f"{process_dir_dict['response']}"))
+            note_failure_reason(process_dir_dict['response'])
+            print_string(f'Object processing time:\t {hm.precisedelta(dt.datetime.now() - iter_start)}')
+            return [obj_dtype, a]
+
+        if process_dir_dict['has_rar']:
+            print_string('{:4}{:<24}{:<60}'.format('', 'Scrubbing result:', f"{process_dir_dict['result'].upper()}"))
+
+        print_string('{:4}{:<24}{:<60}'.format('', 'Next stage:', 'Check if object exists in archive'))
+
+        process_result = instance_check(paths_dict, obj_full_path)
+        if process_result == 'failed':
+            failed_item = [obj_dtype, a]
+        elif process_result == 'deferred':
+            DEFERRED_ITEMS.append([obj_dtype, a])
+
+    print_string(f'Object processing time:\t {hm.precisedelta(dt.datetime.now() - iter_start)}')
+    return failed_item
+#############################################################################################################
+
+
+#############################################################################################################
+def run_action_list(paths_dict, work_items, workers=DEFAULT_WORKERS, num_count=None):
+    # Process (name, type) pairs as they arrive. Only a bounded window of objects is in flight, so the
+    # source listing is never held in memory. Failures are returned in listing order. A daemon stop request
+    # lets the objects in progress finish, but starts no new ones
+    failed_items = {}
+    pipeline = getattr(_LOG_CONTEXT, 'pipeline', None)
+    if workers <= 1:
+        for counter, (a, obj_dtype) in enumerate(work_items, start=1):
+            if _DAEMON_STATE['stop']:
+                print_string('{:<26}  {:<60}'.format('Stop requested:', 'Remaining objects left for the next run'))
+                break
+            # Concurrent pipelines print each object as one block
+            with item_log_group() if pipeline else contextlib.nullcontext():
+                failed_item = process_action_item(paths_dict, a, obj_dtype, counter, num_count)
+            if failed_item:
+                failed_items[counter] = failed_item
+        return [failed_items[c] for c in sorted(failed_items)]
+
+    def worker(counter, a, obj_dtype):
+        if _DAEMON_STATE['stop']:
+            # Queued before the stop request, but not started yet
+            return None
+        _LOG_CONTEXT.pipeline = pipeline
+        with item_log_group():
+            return process_action_item(paths_dict, a, obj_dtype, counter, num_count)
+
+    def collect(futures):
+        for future in futures:
+            failed_item = future.result()
+            if failed_item:
+                failed_items[in_flight[future]] = failed_item
+            del in_flight[future]
+
+    print_string('{:<26}  {:<60}'.format('Parallel workers:', workers))
+    in_flight = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for counter, (a, obj_dtype) in enumerate(work_items, start=1):
+            if len(in_flight) >= workers * 2:
+                collect(wait(in_flight, return_when=FIRST_COMPLETED).done)
+            if _DAEMON_STATE['stop']:
+                print_string('{:<26}  {:<60}'.format('Stop requested:', 'Remaining objects left for the next run'))
+                break
+            in_flight[executor.submit(worker, counter, a, obj_dtype)] = counter
+        collect(list(as_completed(in_flight)))
+
+    return [failed_items[c] for c in sorted(failed_items)]
+#############################################################################################################
+
+
+#############################################################################################################
+def open_source_watcher(source_dir, poll_interval=DEFAULT_POLL_INTERVAL):
+    # Watch the top level of source_dir. Returns the watcher state used by wait_for_source_changes
+    watch_state = {'source_dir': source_dir, 'mode': 'poll', 'poll_interval': poll_interval, 'fd': None}
+
+    libc_name = None
+    if sys.platform.startswith('linux'):
+        # Only needed in daemon mode, so not imported at startup
+        import ctypes
+        import ctypes.util
+        libc_name = ctypes.util.find_library('c')
+    if libc_name:
+        libc = ctypes.CDLL(libc_name, use_errno=True)
+        if hasattr(libc, 'inotify_init1'):
+            fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+            if fd >= 0 and libc.inotify_add_watch(fd, os.fsencode(source_dir), INOTIFY_MASK) >= 0:
+                watch_state.update({'mode': 'inotify', 'fd': fd})
+                return watch_state
+            if fd >= 0:
+                os.close(fd)
+
+    watch_state['snapshot'] = snapshot_source_dir(source_dir)
+    return watch_state
+#############################################################################################################
+
+
+#############################################################################################################
+def snapshot_source_dir(source_dir):
+    snapshot = {}
+    try:
+        with os.scandir(source_dir) as entries:
+            for entry in entries:
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    snapshot[entry.name] = (st.st_ino, st.st_mtime_ns)
+                except OSError:
+                    continue
+    except OSError:
+        pass
+    return snapshot
+#############################################################################################################
+
+
+#############################################################################################################
+def wait_for_source_changes(watch_state, timeout):
+    # Block for up to timeout seconds. Returns the names of top-level entries that changed
+    if watch_state['mode'] == 'inotify':
+        readable, _, _ = select.select([watch_state['fd']], [], [], max(timeout, 0))
+        if not readable:
+            return set()
+        # Give a burst of events (e.g. a large move) a moment to settle, then drain them all
+        time.sleep(0.5)
+        changed = set()
+        while True:
+            try:
+                data = os.read(watch_state['fd'], 65536)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                _, mask, _, name_len = struct.unpack_from('iIII', data, offset)
+                name = data[offset + 16:offset + 16 + name_len].rstrip(b'\0')
+                offset += 16 + name_len
+                if mask & 0x00004000:
+                    # Event queue overflowed, so treat everything as changed
+                    changed.update(os.listdir(watch_state['source_dir']))
+                elif name:
+                    changed.add(os.fsdecode(name))
+        return changed
+
+    # Polling fallback: compare directory snapshots
+    time.sleep(max(min(timeout, watch_state['poll_interval']), 0))
+    snapshot = snapshot_source_dir(watch_state['source_dir'])
+    previous = watch_state['snapshot']
+    watch_state['snapshot'] = snapshot
+    return {name for name in snapshot.keys() | previous.keys() if snapshot.get(name) != previous.get(name)}
+#############################################################################################################
+
+
+#############################################################################################################
+def close_source_watcher(watch_state):
+    if watch_state['fd'] is not None:
+        os.close(watch_state['fd'])
+        watch_state['fd'] = None
+#############################################################################################################
+
+
+#############################################################################################################
+def _daemon_signal_handler(signum, frame):
+    # Finish the object in progress, but stop straight away if idle
+    _DAEMON_STATE['stop'] = True
+    if _DAEMON_STATE['idle']:
+        raise KeyboardInterrupt
+#############################################################################################################
+
+
+#############################################################################################################
+def run_daemon(paths_dict, args):
+    source_dir = paths_dict['source_dir']
+    watch_state = open_source_watcher(source_dir, args.poll_interval)
+    print_string('{:<26}  {:<60}'.format('Daemon mode:', f"watching source with {watch_state['mode']}"))
+    signal.signal(signal.SIGTERM, _daemon_signal_handler)
+    signal.signal(signal.SIGINT, _daemon_signal_handler)
+
+    # The first cycle considers everything in the source directory
+    pending = set(get_fs_objects(source_dir))
+    transmission_index = None
+    next_transmission_poll = 0
+    try:
+        while not _DAEMON_STATE['stop']:
+            if time.monotonic() >= next_transmission_poll:
+                polled_index = get_active_transmission_objects(exit_on_error=False)
+                next_transmission_poll = time.monotonic() + args.transmission_interval
+                if polled_index is not None:
+                    if transmission_index is not None and polled_index['trie'] != transmission_index['trie']:
+                        # Objects Transmission no longer references are now ready to archive
+                        pending |= {o for o in get_fs_objects(source_dir)
+                                    if is_torrent_object(transmission_index, os.path.join(source_dir, o))
+                                    and not is_torrent_object(polled_index, os.path.join(source_dir, o))}
+                    transmission_index = polled_index
+
+            if pending and transmission_index is not None:
+                action_list = sorted(o for o in pending
+                                     if not o.endswith('.DS_Store')
+                                     and os.path.lexists(os.path.join(source_dir, o))
+                                     and not is_torrent_object(transmission_index, os.path.join(source_dir, o)))
+                # Objects still backing off stay pending, and are looked at again on the next wake up
+                backoff_skipped = []
+                action_list = [a for a, _ in skip_backoff(((o, None) for o in action_list), source_dir,
+                                                          load_failure_backoff(), backoff_skipped)]
+                pending = set(backoff_skipped)
+                if action_list and not acquire_run_lock(RUN_LOCK_TIMEOUT):
+                    # Busy with a hook; try these again on the next wake up
+                    pending |= set(action_list)
+                    action_list = []
+                if action_list:
+                    print_string(f'{MARKER_CHAR * 107}')
+                    print_string('{:<26}  {:<60}'.format('Changed objects to process:', len(action_list)))
+                    try:
+                        with stage_timer('classify', objects=len(action_list)):
+                            work_items = list(classify_entries(source_dir, action_list))
+                        failed_items_list = run_cycle(paths_dict, work_items, args)
+                    finally:
+                        release_run_lock()
+                    print_failed_items(failed_items_list)
+                    # Failed objects are offered again once their backoff allows, deferred ones on every wake up
+                    pending |= {name for _, name in failed_items_list}
+                    if DEFERRED_ITEMS:
+                        print_deferred_items()
+                        pending |= {name for _, name in DEFERRED_ITEMS}
+                        DEFERRED_ITEMS.clear()
+                    print_stage_summary()
+                    with _RUN_LOG_LOCK:
+                        STAGE_RECORDS.clear()
+
+            _DAEMON_STATE['idle'] = True
+            try:
+                pending |= wait_for_source_changes(watch_state, next_transmission_poll - time.monotonic())
+            finally:
+                _DAEMON_STATE['idle'] = False
+    except KeyboardInterrupt:
+        pass
+    finally:
+        close_source_watcher(watch_state)
+        print_string('{:<26}  {:<60}'.format('Daemon mode:', 'Stopped'))
+#############################################################################################################
+
+
+#############################################################################################################
+def acquire_run_lock(timeout=0):
+    # Returns True once the lock is held. Holding it already counts
+    if _RUN_LOCK['fd'] is not None:
+        return True
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    fd = open(RUN_LOCK_PATH, 'a')
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            _RUN_LOCK['fd'] = fd
+            return True
+        except BlockingIOError:
+            if time.monotonic() >= deadline:
+                fd.close()
+                return False
+            time.sleep(1)
+#############################################################################################################
+
+
+#############################################################################################################
+def release_run_lock():
+    if _RUN_LOCK['fd'] is not None:
+        fcntl.flock(_RUN_LOCK['fd'], fcntl.LOCK_UN)
+        _RUN_LOCK['fd'].close()
+        _RUN_LOCK['fd'] = None
+#############################################################################################################
+
+
+#############################################################################################################
+def get_torrent_state(host, port, torrent_ref):
+    # One targeted RPC call for a single torrent (by id or hash). None if Transmission no longer has it
+    try:
+        t = get_transmission_client(host, port).get_torrent(torrent_ref, arguments=TORRENT_FIELDS)
+    except KeyError:
+        return None
+    return {f: t.fields.get(f) for f in TORRENT_FIELDS}
+#############################################################################################################
+
+
+#############################################################################################################
+def cached_torrent_index(host, port, exclude_ids=(), exclude_hashes=()):
+    # Torrent index built from the last poll's snapshot and file lists, without any RPC. None without a snapshot
+    snapshot = load_transmission_snapshot(host, port)
+    if snapshot is None:
+        return None
+    try:
+        with open(os.path.join(CACHE_DIR, f'transmission_files_{host}_{port}.json')) as f:
+            files_cache = json.load(f)
+    except (OSError, ValueError):
+        files_cache = {}
+    torrents = {torrent_id: t for torrent_id, t in snapshot['torrents'].items()
+                if torrent_id not in exclude_ids and t.get('hashString') not in exclude_hashes}
+    torrent_files = {torrent_id: files_cache.get(f"{t['hashString']}:{t['name']}", [])
+                     for torrent_id, t in torrents.items()}
+    return build_torrent_index(torrents, torrent_files)
+#############################################################################################################
+
+
+#############################################################################################################
+def run_torrent_done_hook(paths_dict, args):
+    # Entry point for Transmission's script-torrent-done: archive just the finished torrent's object,
+    # instead of listing the source directory and polling every torrent
+    torrent_name = os.getenv('TR_TORRENT_NAME')
+    torrent_dir = os.getenv('TR_TORRENT_DIR')
+    torrent_hash = os.getenv('TR_TORRENT_HASH')
+    torrent_id = os.getenv('TR_TORRENT_ID')
+    if not torrent_name or not torrent_dir or not (torrent_hash or torrent_id):
+        print_string('TR_TORRENT_NAME, TR_TORRENT_DIR and TR_TORRENT_ID or TR_TORRENT_HASH must be set')
+        return ['hook', torrent_name or '']
+    if not torrent_hash and not torrent_id.isdigit():
+        print_string('{:<26}  {:<60}'.format('Invalid TR_TORRENT_ID:', torrent_id))
+        return ['hook', torrent_name]
+    # transmission_rpc only takes string ids that are hashes, so a numeric id is passed as an int
+    torrent_ref = torrent_hash or int(torrent_id)
+    print_string('{:<26}  {:<60}'.format('Torrent done:', torrent_name))
+
+    # The object to archive is the top level source entry holding the torrent
+    source_dir = os.path.abspath(paths_dict['source_dir'])
+    rel_path = os.path.relpath(os.path.join(os.path.abspath(torrent_dir), torrent_name), source_dir)
+    if rel_path == '.' or rel_path.startswith(os.pardir):
+        print_string('{:<26}  {:<60}'.format('Nothing to be done:', f'Not under {source_dir}'))
+        return None
+    obj_name = pathlib.PurePosixPath(rel_path).parts[0]
+    obj_full_path = os.path.join(source_dir, obj_name)
+
+    # The finished torrent itself is still in the last poll's snapshot, under whichever reference it's known by
+    exclude_ids = {int(torrent_id)} if torrent_id and torrent_id.isdigit() else set()
+    exclude_hashes = {torrent_hash} if torrent_hash else set()
+    with stage_timer('transmission_poll', torrents=1) as record:
+        try:
+            state = get_torrent_state(TRANSMISSION_HOST, TRANSMISSION_PORT, torrent_ref)
+            if state is not None:
+                exclude_ids.add(int(state['id']))
+            if state is not None and args.remove_torrent:
+                # Transmission keeps the data; the object is archived from here on
+                get_transmission_client(TRANSMISSION_HOST, TRANSMISSION_PORT).remove_torrent(state['id'],
+                                                                                           delete_data=False)
+                print_string('{:<26}  {:<60}'.format('Torrent removed:', 'Data kept for archiving'))
+                state = None
+        except Exception as e:
+            # Unreachable Transmission or a rejected call. Without its answer the object can't be known to be free
+            print_string('{:<26}  {:<60}'.format('API call failed:', str(e)))
+            record['error'] = str(e)
+            return ['hook', obj_name]
+        record['loaded'] = state is not None
+    if state is not None:
+        print_string('{:<26}  {:<60}'.format('Nothing to be done:', f"Torrent still loaded (status {state['status']}). "
+                                                                      f"It is archived once removed"))
+        return None
+
+    # Another loaded torrent may share the object. The last poll's snapshot answers that without an RPC
+    index = cached_torrent_index(TRANSMISSION_HOST, TRANSMISSION_PORT, exclude_ids, exclude_hashes)
+    if index is not None and is_torrent_object(index, obj_full_path):
+        print_string('{:<26}  {:<60}'.format('Nothing to be done:', 'Object is shared with another torrent'))
+        return None
+
+    if not acquire_run_lock(RUN_LOCK_TIMEOUT):
+        print_string('{:<26}  {:<60}'.format('Run lock:', 'Timed out waiting for another run ...Exiting...'))
+        return ['hook', obj_name]
+    try:
+        failed_items_list = run_action_list(paths_dict, classify_entries(source_dir, [obj_name]), 1, 1)
+    finally:
+        release_run_lock()
+    return failed_items_list[0] if failed_items_list else None
+#############################################################################################################
+
+
+#############################################################################################################
+def plan_object(paths_dict, a, obj_dtype, copy_rate):
+    # Metadata-only decision for one object: no scrubbing, no moves
+    obj_full_path = os.path.join(paths_dict['source_dir'], a)
+    plan_entry = {
+        'name': a,
+        'type': obj_dtype,
+        'action': 'unlink',
+        'scrub': False,
+        'bytes': 0,
+        'method': 'none',
+        'src_dev': None,
+        'dest_dev': None,
+        'est_seconds': 0.0,
+        'mtime': 0.0
+    }
+    if obj_dtype == 'symlink':
+        return plan_entry
+
+    obj_stat = os.lstat(obj_full_path)
+    plan_entry['src_dev'] = obj_stat.st_dev
+    if obj_dtype == 'file':
+        obj_bytes = obj_stat.st_size
+        plan_entry['mtime'] = obj_stat.st_mtime
+    else:
+        tree_stats = scan_tree(obj_full_path)
+        obj_bytes = tree_stats['size']
+        plan_entry['mtime'] = max(tree_stats['max_mtime'], obj_stat.st_mtime)
+        if any(o.endswith('.rar') for o in os.listdir(obj_full_path)):
+            # The unpacked file will be scrubbed before the move
+            plan_entry['scrub'] = True
+            try:
+                target_file = list_files_from_rar(obj_full_path)
+                if isinstance(target_file, str):
+                    obj_bytes -= os.path.getsize(os.path.join(obj_full_path, target_file))
+            except (OSError, ValueError, struct.error, IndexError, subprocess.CalledProcessError):
+                pass
+
+    exists_dict = check_if_object_exists_at_dest(paths_dict['archive_dir'], obj_full_path)
+    if not exists_dict['exists']:
+        plan_entry['action'] = 'archive'
+    elif exists_dict['action'] == 'archive':
+        plan_entry['action'] = 'replace'
+    else:
+        plan_entry['action'] = 'graveyard'
+    plan_entry['relation'] = exists_dict.get('relation')
+
+    dest_dir = paths_dict['graveyard_dir'] if plan_entry['action'] == 'graveyard' else paths_dict['archive_dir']
+    plan_entry['dest_dev'] = os.stat(dest_dir).st_dev
+    plan_entry['bytes'] = obj_bytes
+    if plan_entry['src_dev'] == plan_entry['dest_dev']:
+        plan_entry['method'] = 'rename'
+        plan_entry['est_seconds'] = RENAME_SECONDS
+    else:
+        plan_entry['method'] = 'copy'
+        plan_entry['est_seconds'] = obj_bytes / (copy_rate * 1000 * 1000)
+    return plan_entry
+#############################################################################################################
+
+
+#############################################################################################################
+def build_plan(paths_dict, work_items, copy_rate=DEFAULT_COPY_RATE_MBPS):
+    # One metadata pass over the (name, type) pairs. Objects are ordered cheapest first: unlinks, then renames,
+    # then copies by size, so quick wins aren't queued behind large copies
+    plan = []
+    for a, obj_dtype in work_items:
+        try:
+            plan.append(plan_object(paths_dict, a, obj_dtype, copy_rate))
+        except OSError as e:
+            plan.append({'name': a, 'type': obj_dtype, 'action': 'error', 'scrub': False, 'bytes': 0,
+                         'method': 'none', 'src_dev': None, 'dest_dev': None, 'est_seconds': 0.0,
+                         'response': str(e)})
+
+    plan.sort(key=lambda p: (PLAN_ACTION_ORDER.get(p['action'], 2), p['method'] == 'copy', p['est_seconds']))
+    return plan
+#############################################################################################################
+
+
+#############################################################################################################
+def select_for_watermarks(plan, usage, high_watermark, low_watermark, order=DEFAULT_WATERMARK_ORDER):
+    # Below the high watermark nothing is archived. Above it, pick cross-device moves (the only ones that free
+    # source space) largest-first or oldest-first, until the projected usage drops to the low watermark
+    selected = [p for p in plan if p['action'] == 'unlink']
+    if usage['percent'] < high_watermark:
+        return selected, 0
+
+    to_free = usage['used'] - usage['total'] * low_watermark / 100
+    if order == 'largest':
+        candidates = sorted((p for p in plan if p['method'] == 'copy'), key=lambda p: p['bytes'], reverse=True)
+    else:
+        candidates = sorted((p for p in plan if p['method'] == 'copy'), key=lambda p: p['mtime'])
+    freed = 0
+    for p in candidates:
+        if freed >= to_free:
+            break
+        selected.append(p)
+        freed += p['bytes']
+
+    # Keep the plan's cost-aware execution order
+    selected_names = {p['name'] for p in selected}
+    return [p for p in plan if p['name'] in selected_names], freed
+#############################################################################################################
+
+
+#############################################################################################################
+def print_plan(plan):
+    print_string(f'{MARKER_CHAR * 100}')
+    print_string('{:<4}{:<16}{:<8}{:>12}{:>10}  {:<60}'.format('#', 'Action', 'Method', 'Size', 'Est.', 'Object'))
+    for i, p in enumerate(plan, start=1):
+        action = f"{p['action']}+scrub" if p['scrub'] else p['action']
+        print_string('{:<4}{:<16}{:<8}{:>12}{:>10}  {:<60}'.format(
+            i, action, p['method'], hm.naturalsize(p['bytes']) if p['bytes'] else '-', f"{p['est_seconds']:.1f}s", p['name']))
+    print_string(f'{MARKER_CHAR * 100}')
+
+    copy_bytes = sum(p['bytes'] for p in plan if p['method'] == 'copy')
+    print_string('{:<28}{:<60}'.format('Objects planned:', len(plan)))
+    print_string('{:<28}{:<60}'.format('Bytes to copy:', hm.naturalsize(copy_bytes)))
+    print_string('{:<28}{:<60}'.format('Estimated runtime:', hm.precisedelta(
+        dt.timedelta(seconds=sum(p['est_seconds'] for p in plan)))))
+#############################################################################################################
+
+
+#############################################################################################################
+def execute_plan(paths_dict, plan, args):
+    # Run the plan in its cost-aware order. Decisions are re-checked as each object is processed,
+    # so anything that changed since planning is still handled correctly
+    failed_items_list = [[p['type'], p['name']] for p in plan if p['action'] == 'error']
+    work_items = [(p['name'], p['type']) for p in plan if p['action'] != 'error']
+    with stage_timer('process', objects=len(work_items)) as record:
+        failed_items_list += run_action_list(paths_dict, work_items, args.workers, len(work_items))
+        record['failed'] = len(failed_items_list)
+    return failed_items_list
+#############################################################################################################
+
+
+#############################################################################################################
+def run_planned_cycle(paths_dict, work_items, args):
+    # Planning needs every object up front, to order them
+    work_items = list(work_items)
+    with stage_timer('plan', objects=len(work_items)) as record:
+        plan = build_plan(paths_dict, work_items, args.copy_rate)
+        record['bytes'] = sum(p['bytes'] for p in plan if p['method'] == 'copy')
+
+    if args.high_watermark is not None:
+        usage = volume_usage(paths_dict['source_dir'])
+        low_watermark = args.low_watermark if args.low_watermark is not None else args.high_watermark - DEFAULT_WATERMARK_GAP
+        print_string('{:<26}  {:<60}'.format('Source volume usage:', f"{usage['percent']:.1f}% "
+                                             f"(high {args.high_watermark}%, low {low_watermark}%)"))
+        plan, freed = select_for_watermarks(plan, usage, args.high_watermark, low_watermark, args.order)
+        if freed:
+            print_string('{:<26}  {:<60}'.format('Selected to free:', f'{hm.naturalsize(freed)} ({args.order} first)'))
         else:
-            scrubber_result_dict = {
-                'scrub_file': target_file,
-                'result': 'failed',
-                'response': f'Response: {str(e)}'
-            }
-            return scrubber_result_dict
+            print_string('{:<26}  {:<60}'.format('Selected to free:', 'Nothing, source is below the high watermark'))
+
+    print_plan(plan)
+    if args.dry_run:
+        print_string('{:<28}{:<60}'.format('Dry run', '...No changes made...'))
+        return []
+    return execute_plan(paths_dict, plan, args)
+#############################################################################################################
+
+
+#############################################################################################################
+def graveyard_object_bytes(path):
+    # Bytes an eviction frees. Files hardlinked to the archive copy (--graveyard-hardlinks) are shared, so
+    # removing them frees nothing
+    if SIZE_CACHE_ENABLED:
+        try:
+            tree_stats = cached_tree_stats(path)
+            return tree_stats['size'] - tree_stats['linked']
+        except sqlite3.Error as e:
+            print_string('{:4}{:<24}{:<60}'.format('', 'Size cache error:', str(e)))
+    tree_stats = scan_tree(path)
+    return tree_stats['size'] - tree_stats['linked']
+#############################################################################################################
+
+
+#############################################################################################################
+def graveyard_items(graveyard_dir):
+    # Top level Graveyard objects, oldest arrival first. Directory sizes come from the size cache and only
+    # count data that isn't shared with another hardlink
+    items = []
+    with os.scandir(graveyard_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith('.'):
+                # Staging copies of moves still in progress
+                continue
+            st = entry.stat(follow_symlinks=False)
+            if entry.is_dir(follow_symlinks=False):
+                size = graveyard_object_bytes(entry.path)
+            else:
+                size = st.st_size if entry.is_file(follow_symlinks=False) and st.st_nlink == 1 else 0
+            items.append({'name': entry.name, 'path': entry.path, 'bytes': size, 'landed': st.st_ctime})
+    return sorted(items, key=lambda i: i['landed'])
+#############################################################################################################
+
+
+#############################################################################################################
+def graveyard_duplicate(item_path, archive_dir):
+    # The archive object holding everything in this Graveyard item, found under the same name or through the
+    # catalog, or None. Fingerprints are cached, so a later sweep doesn't re-read the same files
+    candidates = []
+    same_name = os.path.join(archive_dir, os.path.basename(item_path))
+    if os.path.lexists(same_name):
+        candidates.append(same_name)
+    if os.path.abspath(archive_dir) in CATALOG_ROOTS:
+        candidates += [c['path'] for c in catalog_lookup(item_path) if c['path'] != same_name]
+    for candidate in candidates:
+        if compare_fingerprints_of_two_objects(item_path, candidate)['relation'] in GRAVEYARD_DUPLICATE_RELATIONS:
+            return candidate
+    return None
+#############################################################################################################
+
+
+#############################################################################################################
+def select_graveyard_evictions(items, archive_dir, budget=None, max_age=None, now=None):
+    # Everything older than max_age goes. If the rest is still over budget, confirmed duplicates go oldest first,
+    # then, only if that wasn't enough, the oldest unconfirmed items
+    now = now or time.time()
+    evictions = []
+    remaining = []
+    for item in items:
+        if max_age is not None and now - item['landed'] > max_age:
+            evictions.append({**item, 'reason': 'age'})
+        else:
+            remaining.append(item)
+
+    total = sum(i['bytes'] for i in remaining)
+    if budget is None or total <= budget:
+        return evictions, total
+
+    kept = []
+    for item in remaining:
+        # Items entirely hardlinked to the archive free nothing, so they don't help the budget
+        if total > budget and item['bytes'] and (duplicate := graveyard_duplicate(item['path'], archive_dir)):
+            evictions.append({**item, 'reason': 'duplicate', 'duplicate': duplicate})
+            total -= item['bytes']
+        else:
+            kept.append(item)
+    for item in kept:
+        if total <= budget:
+            break
+        if not item['bytes']:
+            continue
+        evictions.append({**item, 'reason': 'budget'})
+        total -= item['bytes']
+    return evictions, total
+#############################################################################################################
+
+
+#############################################################################################################
+def evict_graveyard_item(item):
+    path = item['path']
+    if os.path.isdir(path) and not os.path.islink(path):
+        shutil.rmtree(path)
+        with _CACHE_DB_LOCK:
+            _delete_cached_subtree(cache_db(), os.path.abspath(path))
+    else:
+        os.unlink(path)
+#############################################################################################################
+
+
+#############################################################################################################
+def run_graveyard_sweep(paths_dict, args):
+    # Enforce --graveyard-budget and --graveyard-max-age. With --dry-run, only report what would be evicted
+    graveyard_dir = paths_dict['graveyard_dir']
+    budget = int(args.graveyard_budget * 1000 * 1000 * 1000) if args.graveyard_budget is not None else None
+    max_age = args.graveyard_max_age * DAY_SECONDS if args.graveyard_max_age is not None else None
+    print_string('{:<26}  {:<60}'.format('Sweeping Graveyard:', graveyard_dir))
+    if not os.path.isdir(graveyard_dir):
+        print_string('{:<26}  {:<60}'.format('Graveyard sweep:', 'No Graveyard directory'))
+        return {'evicted': 0, 'bytes': 0}
+
+    with stage_timer('sweep_plan') as record:
+        items = graveyard_items(graveyard_dir)
+        evictions, kept_bytes = select_graveyard_evictions(items, paths_dict['archive_dir'], budget, max_age)
+        record.update(objects=len(items), bytes=sum(i['bytes'] for i in items), evictions=len(evictions))
+    print_string('{:<26}  {:<60}'.format('Graveyard objects:', f"{len(items)} "
+                                         f"({hm.naturalsize(sum(i['bytes'] for i in items))})"))
+    limits = [f'budget {hm.naturalsize(budget)}' if budget is not None else '',
+              f'max age {args.graveyard_max_age:g} days' if max_age is not None else '']
+    print_string('{:<26}  {:<60}'.format('Retention:', ', '.join(l for l in limits if l)))
+
+    if evictions:
+        now = time.time()
+        print_string(f'{MARKER_CHAR * 100}')
+        print_string('{:<4}{:<12}{:>12}{:>10}  {:<60}'.format('#', 'Reason', 'Size', 'Age', 'Object'))
+        for i, e in enumerate(evictions, start=1):
+            print_string('{:<4}{:<12}{:>12}{:>10}  {:<60}'.format(
+                i, e['reason'], hm.naturalsize(e['bytes']), f"{(now - e['landed']) / DAY_SECONDS:.1f}d", e['name']))
+        print_string(f'{MARKER_CHAR * 100}')
+
+    if args.dry_run:
+        print_string('{:<26}  {:<60}'.format('Would evict:', f"{len(evictions)} "
+                                             f"({hm.naturalsize(sum(e['bytes'] for e in evictions))}), "
+                                             f"keeping {hm.naturalsize(kept_bytes)}"))
+        return {'evicted': 0, 'bytes': 0}
+
+    evicted = 0
+    evicted_bytes = 0
+    for e in evictions:
+        with stage_timer('sweep', item=e['name'], reason=e['reason'], bytes=e['bytes']) as record:
+            try:
+                evict_graveyard_item(e)
+                evicted += 1
+                evicted_bytes += e['bytes']
+                record['result'] = 'success'
+            except OSError as err:
+                record['result'] = 'failed'
+                print_string('{:4}{:<24}{:<60}'.format('', 'Eviction failed:', f"{e['name']}: {err}"))
+    print_string('{:<26}  {:<60}'.format('Evicted:', f'{evicted} ({hm.naturalsize(evicted_bytes)})'))
+    return {'evicted': evicted, 'bytes': evicted_bytes}
+#############################################################################################################
+
+
+#############################################################################################################
+def run_cycle(paths_dict, work_items, args):
+    # Process a stream of (name, type) pairs. Returns the failed items
+    if args.plan or args.dry_run or args.high_watermark is not None:
+        return run_planned_cycle(paths_dict, work_items, args)
+
+    counts = {}
+    with stage_timer('process') as record:
+        failed_items_list = run_action_list(paths_dict, count_entries(work_items, counts), args.workers)
+        record.update(objects=sum(counts.values()), failed=len(failed_items_list))
+    print_string('{:<26}  {:<60}'.format('Total objects processed:', sum(counts.values())))
+    print_obj_counts(counts)
+    return failed_items_list
+#############################################################################################################
+
+
+#############################################################################################################
+def stream_action_items(source_dir, transmission_index, listed_counts, backoff_skipped):
+    # (name, type) pairs of source objects Transmission doesn't reference and that aren't backing off. The
+    # listing is finished up front: anything that appears after the Transmission poll isn't in its index, and
+    # reading the directory while objects are renamed out of it may skip entries. Entries are classified by
+    # the listing itself, from their directory entry types
+    with stage_timer('fs_listing') as record:
+        listed_items = list(count_entries(scan_source_entries(source_dir), listed_counts))
+        record['objects'] = len(listed_items)
+    with stage_timer('dedupe') as record:
+        action_items = [(a, obj_dtype) for a, obj_dtype in listed_items
+                        if not is_torrent_object(transmission_index, os.path.join(source_dir, a))]
+        record['objects'] = len(action_items)
+    return skip_backoff(action_items, source_dir, load_failure_backoff(), backoff_skipped)
+#############################################################################################################
+
+
+#############################################################################################################
+def load_pipelines(config_path):
+    # JSON: {"pipelines": [{"name", "source_dir", "archive_dir", optional "graveyard_dir", "trash_dir",
+    # "transmission_host", "transmission_port"}]}. The Graveyard defaults to a sibling of the archive directory
+    with open(os.path.expanduser(config_path)) as f:
+        config = json.load(f)
+
+    pipelines = []
+    for i, entry in enumerate(config.get('pipelines', [])):
+        missing = [k for k in ('source_dir', 'archive_dir') if not entry.get(k)]
+        if missing:
+            raise ValueError(f"Pipeline {i + 1} is missing {', '.join(missing)}")
+        archive_dir = os.path.abspath(os.path.expanduser(entry['archive_dir']))
+        pipelines.append({
+            'name': entry.get('name') or f'pipeline{i + 1}',
+            'paths_dict': {
+                'source_dir': os.path.abspath(os.path.expanduser(entry['source_dir'])),
+                'archive_dir': archive_dir,
+                'graveyard_dir': os.path.abspath(os.path.expanduser(
+                    entry.get('graveyard_dir') or os.path.join(os.path.dirname(archive_dir), 'Graveyard'))),
+                'trash_dir': os.path.expanduser(entry.get('trash_dir') or os.path.join(USER_VOLUME, '.Trash'))
+            },
+            'transmission_host': entry.get('transmission_host', TRANSMISSION_HOST),
+            'transmission_port': int(entry.get('transmission_port', TRANSMISSION_PORT))
+        })
+    if not pipelines:
+        raise ValueError('No pipelines configured')
+    return pipelines
 #############################################################################################################
 
 
 #############################################################################################################
-def main():
+def run_pipeline_cycle(pipeline, transmission_index, args):
+    # One pipeline's listing and processing, run in a thread. Returns its failed items
+    _LOG_CONTEXT.pipeline = pipeline['name']
+    paths_dict = pipeline['paths_dict']
+    try:
+        listed_counts = {}
+        backoff_skipped = []
+        action_items = stream_action_items(paths_dict['source_dir'], transmission_index, listed_counts,
+                                           backoff_skipped)
+        failed_items_list = run_cycle(paths_dict, action_items, args)
+        print_string('{:<26}  {:<60}'.format(f"[{pipeline['name']}] Objects:",
+                                               f'{sum(listed_counts.values())} listed, '
+                                               f'{len(backoff_skipped)} backing off, {len(failed_items_list)} failed'))
+        return [[f[0], f"{pipeline['name']}: {f[1]}"] for f in failed_items_list]
+    finally:
+        _LOG_CONTEXT.pipeline = None
+#############################################################################################################
+
+
+#############################################################################################################
+async def run_pipelines_async(pipelines, args):
+    # Every Transmission is polled at once, and only once when pipelines share it. Each pipeline is then queued
+    # on its archive device, and every device works through its own queue, so a slow archive disk only holds
+    # up the pipelines writing to it
+    import asyncio
+    device_queues = {}
+    transmissions = {}
+    for pipeline in pipelines:
+        device = os.stat(pipeline['paths_dict']['archive_dir']).st_dev
+        pipeline['device'] = device
+        device_queues.setdefault(device, asyncio.Queue())
+        transmissions.setdefault((pipeline['transmission_host'], pipeline['transmission_port']), []).append(pipeline)
+    failed_items_list = []
+
+    async def poll(host, port, members):
+        with stage_timer('transmission_poll', transmission=f'{host}:{port}') as record:
+            index = await asyncio.to_thread(get_active_transmission_objects, False, host, port)
+            record['torrents'] = index['torrents'] if index else None
+        for pipeline in members:
+            if index is None:
+                # Without Transmission's view nothing can be known to be inactive
+                failed_items_list.append(['pipeline', f"{pipeline['name']}: Transmission poll failed"])
+            else:
+                await device_queues[pipeline['device']].put((pipeline, index))
+
+    async def drain(queue):
+        while (queued := await queue.get()) is not None:
+            failed_items_list.extend(await asyncio.to_thread(run_pipeline_cycle, *queued, args))
+
+    drains = [asyncio.create_task(drain(queue)) for queue in device_queues.values()]
+    await asyncio.gather(*(poll(host, port, members) for (host, port), members in transmissions.items()))
+    for queue in device_queues.values():
+        await queue.put(None)
+    await asyncio.gather(*drains)
+    return failed_items_list
+#############################################################################################################
+
+
+#############################################################################################################
+def run_pipelines(args):
+    try:
+        pipelines = load_pipelines(args.pipelines)
+    except (OSError, ValueError) as e:
+        print_string('{:<28}{:<60}'.format('Pipeline config error:', str(e)))
+        sys.exit(1)
+
+    for pipeline in pipelines:
+        print_string('{:<28}{:<60}'.format('Pipeline:', f"{pipeline['name']} "
+                                             f"({pipeline['transmission_host']}:{pipeline['transmission_port']})"))
+        print_env(pipeline['paths_dict'])
+        if not args.no_catalog:
+            CATALOG_ROOTS.add(pipeline['paths_dict']['archive_dir'])
+
+    if not acquire_run_lock():
+        print_string('{:<28}{:<60}'.format('Another run is in progress', '...Exiting...'))
+        return []
+    try:
+        if args.sweep_graveyard or args.sweep_only:
+            # Pipelines may share an archive volume, so each Graveyard is only swept once
+            swept = set()
+            for pipeline in pipelines:
+                if pipeline['paths_dict']['graveyard_dir'] not in swept:
+                    swept.add(pipeline['paths_dict']['graveyard_dir'])
+                    run_graveyard_sweep(pipeline['paths_dict'], args)
+            if args.sweep_only:
+                return []
+        if not args.dry_run:
+            with stage_timer('resume') as record:
+                record['moves'] = len(resume_journal_moves())
+        # Only pipeline runs pay for importing asyncio
+        import asyncio
+        return asyncio.run(run_pipelines_async(pipelines, args))
+    finally:
+        release_run_lock()
+#############################################################################################################
+
+
+#############################################################################################################
+def print_failed_items(failed_items_list):
+    if not failed_items_list:
+        return
+    print_string('')
+    print_string('Failed to archive these objects:')
+    for f in failed_items_list:
+        print_string('{:4}{:>10}:{:4}{:<60}'.format('', f'{f[0].title()}', '', f'{f[1]}'))
+    print_string('')
+#############################################################################################################
+
+
+#############################################################################################################
+def print_deferred_items():
+    print_string('')
+    print_string('Deferred until the destination has room:')
+    for f in DEFERRED_ITEMS:
+        print_string('{:4}{:>10}:{:4}{:<60}'.format('', f'{f[0].title()}', '', f'{f[1]}'))
+    print_string('')
+#############################################################################################################
+
+
+#############################################################################################################
+def main(args=None):
+    if args is None:
+        args = parse_args()
+    mark_startup('Argument parsing')
+
+    env_source = load_environment()
+    mark_startup(f'Environment ({env_source})')
+    if (not SOURCE_VOLUME or not ARCHIVE_VOLUME) and not args.pipelines:
+        print_string('TORBASE and TORARCHIVE must be set (environment, config file or shell profile)')
+        sys.exit(1)
+
+    global DEVICE_CONCURRENCY, COPY_ENGINE, SIZE_CACHE_ENABLED, COMPARE_MODE, VERIFY_SCRUB, GRAVEYARD_HARDLINKS
+    DEVICE_CONCURRENCY = args.device_concurrency
+    COPY_ENGINE = args.copy_engine
+    SIZE_CACHE_ENABLED = not args.no_size_cache
+    COMPARE_MODE = args.compare_mode
+    VERIFY_SCRUB = not args.no_verify_scrub
+    GRAVEYARD_HARDLINKS = args.graveyard_hardlinks
+    configure_throttle(args.rate_limit, args.rate_profile, args.adaptive_throttle, args.transmission_busy)
+    if not args.no_run_log:
+        open_run_log(args.run_log or os.path.join(LOG_DIR, f'run_{TODAY_DATESTAMP}.jsonl'))
+    if args.profile or args.profile_memory or args.sample_profile:
+        start_profiling(args.profile, args.profile_memory, args.sample_profile)
+
+    if args.pipelines:
+        print(f'\n{MARKER_CHAR * 140}')
+        print_string('{:<23}{:<60}'.format('Starting execution of', __file__))
+        print_string(f'{MARKER_CHAR * 107}')
+        failed_items_list = run_pipelines(args)
+        print(f'{MARKER_CHAR * 140}')
+        print_failed_items(failed_items_list)
+        if DEFERRED_ITEMS:
+            print_deferred_items()
+        print_stage_summary()
+        print_string(f'Execution completed. Total runtime:\t {hm.precisedelta(dt.datetime.now() - START_TIME)}')
+        print(f'{MARKER_CHAR * 140}\n')
+        return
+
     # Setup environment
     paths_dict = {
         'source_dir': os.path.join(SOURCE_VOLUME, 'zzzNew'),
@@ -484,7 +3639,6 @@ def main():
     }
     my_obj = __file__
     p = pathlib.Path(my_obj)
-    failed_items_list = []
 
     print(f'\n{MARKER_CHAR * 140}')
     print(f'{MARKER_CHAR * 140}')
@@ -496,135 +3650,120 @@ def main():
     if '__DEV' in str(p.parent):
         paths_dict = execution_env_is_dev(paths_dict)
     print_env(paths_dict)
+    if not args.no_catalog:
+        CATALOG_ROOTS.add(os.path.abspath(paths_dict['archive_dir']))
+
+    # Cache maintenance runs on its own
+    if args.size_cache:
+        run_size_cache_command(args.size_cache, paths_dict)
+        return
+    if args.failures:
+        run_failures_command(args.failures)
+        return
+    if args.rebuild_catalog:
+        print_string('{:<28}{:<60}'.format('Action:', 'Rebuilding archive catalog'))
+        with stage_timer('catalog_rebuild') as record:
+            record['objects'] = rebuild_catalog(paths_dict['archive_dir'])
+        print_string('{:<28}{:<60}'.format('Cataloged objects:', record['objects']))
+        return
+
+    if args.torrent_done:
+        failed_item = run_torrent_done_hook(paths_dict, args)
+        print_failed_items([failed_item] if failed_item else [])
+        print_stage_summary()
+        sys.exit(1 if failed_item else 0)
+
+    if not acquire_run_lock(RUN_LOCK_TIMEOUT if args.daemon else 0):
+        print_string('{:<28}{:<60}'.format('Another run is in progress', '...Exiting...'))
+        return
+
+    if args.sweep_only:
+        run_graveyard_sweep(paths_dict, args)
+        print_stage_summary()
+        release_run_lock()
+        return
+
+    # Finish moves an earlier run was interrupted in
+    if not args.dry_run:
+        with stage_timer('resume') as record:
+            record['moves'] = len(resume_journal_moves())
+
+    if args.daemon:
+        # The daemon only holds the lock while it works through a cycle
+        release_run_lock()
+        run_daemon(paths_dict, args)
+        return
 
     ####################################################################################################################
     # This is the start
     ####################################################################################################################
     stage_num = 1
+    if args.startup_profile:
+        print_startup_profile()
 
     #
     # Stage description: Collect active Transmission objects
     ####################################################################################################################
-    transmission_objects = get_active_transmission_objects()
-    if transmission_objects == 'empty':
-        sys.exit(0)
-    print_string('{:<26}  {:<60}'.format('Transmission objects:', len(transmission_objects)))
+    with stage_timer('transmission_poll', stage_num=stage_num) as record:
+        transmission_index = get_active_transmission_objects()
+        record.update(torrents=transmission_index['torrents'], files=transmission_index['files'])
+    print_string('{:<26}  {:<60}'.format('Transmission objects:', transmission_index['torrents']))
+    print_string('{:<26}  {:<60}'.format('Transmission files:', transmission_index['files']))
     stage_num += 1
 
     #
-    # Stage description: Collect file system objects
+    # Stage description: Enforce the Graveyard's retention limits, freeing archive space before anything is moved
     ####################################################################################################################
-    filesystem_objects = get_fs_objects(paths_dict['source_dir'])
-    print_string('{:<26}  {:<60}'.format('Filesystem objects:', len(filesystem_objects)))
-    stage_num += 1
+    if args.sweep_graveyard:
+        run_graveyard_sweep(paths_dict, args)
+        stage_num += 1
 
     #
-    # Stage description: De-dupe 2 lists of objects into action list
+    # Stage description: List file system objects, drop the ones Transmission references, then classify and
+    # process the rest one by one. In plan mode, every decision is made up front and objects run in
+    # cost-aware order
     ####################################################################################################################
-    action_list = [i for i in filesystem_objects if i not in transmission_objects]
-    print_string('{:<26}  {:<60}'.format('Total objects to process:', len(action_list)))
-    if not action_list:
+    listed_counts = {}
+    backoff_skipped = []
+    memory_checkpoint('before listing')
+    action_items = stream_action_items(paths_dict['source_dir'], transmission_index, listed_counts, backoff_skipped)
+    first_item = next(action_items, None)
+    if first_item is None:
         # This is the end
-        print_string('{:<28}{:<60}'.format('Nothing to be done here     ...Exiting...', ''))
+        if not listed_counts:
+            print_string('{:<28}"{:<60}"'.format('No file system objects fetched   ...Exiting...', ''))
+        else:
+            print_string('{:<26}  {:<60}'.format('Filesystem objects:', sum(listed_counts.values())))
+            if backoff_skipped:
+                print_string('{:<26}  {:<60}'.format('Skipped, backing off:', len(backoff_skipped)))
+            print_string('{:<28}{:<60}'.format('Nothing to be done here     ...Exiting...', ''))
         print(f'{MARKER_CHAR * 140}')
         print_string(f'Execution completed. Total runtime:\t {hm.precisedelta(dt.datetime.now() - START_TIME)}')
         print(f'{MARKER_CHAR * 140}')
         print(f'{MARKER_CHAR * 140}\n')
         sys.exit(0)
-    stage_num += 1
-
-    #
-    # Stage description: Classify each object
-    ####################################################################################################################
-    files, directories, symlinks = classify_directory_contents(paths_dict['source_dir'], action_list)
-    print_obj_counts(files, directories, symlinks)
-    stage_num += 1
-
-    #
-    # Stage description: Loop over action_list, processing each object, by classification type
-    ####################################################################################################################
-    num_count = len(action_list)
-    counter = 1
-
-    for a in action_list:
-        # Iteration separation
-        print_string(f'{MARKER_CHAR * 100}')
-        iter_start = dt.datetime.now()
-        obj_full_path = os.path.join(paths_dict['source_dir'], a)
-
-        print_string('{:<12}{:<60}'.format(f'Object ({counter} / {num_count}):\t ', a))
-        print_string(f'{MARKER_CHAR * 100}')
-
-        # List 'symlinks'
-        ################################################################################################################
-        if a in symlinks:
-            obj_dtype = 'symlink'
-            print_string('{:4}{:<24}{:<60}'.format('', 'Object data type:', obj_dtype.upper()))
-            print_string('{:4}{:<24}{:<60}'.format('', 'Next stage:', 'Unlinking'))
-
-            response_dict = process_symlink(obj_full_path)
-            print_string('{:4}{:<24}{:<60}'.format('', 'Unlinking result:', response_dict['result'].upper()))
-            if response_dict['result'] != 'success':
-                print_string('{:4}{:<24}{:<60}'.format('', 'Unlinking response:', response_dict['response']))
-                failed_items_list.append([obj_dtype, a])
 
-            print_string(f'Object processing time:\t {hm.precisedelta(dt.datetime.now() - iter_start)}')
-            counter += 1
-
-        # List 'files'
-        ################################################################################################################
-        elif a in files:
-            obj_dtype = 'file'
-            print_string('{:4}{:<24}{:<60}'.format('', 'Object data type:', obj_dtype.upper()))
-            print_string('{:4}{:<24}{:<60}'.format('', 'Next stage:', 'Check if object exists in archive'))
-
-            # Check if there is already a version in target archive
-            process_result = instance_check(paths_dict, obj_full_path)
-            if process_result == 'failed':
-                failed_items_list.append([obj_dtype, a])
-
-            print_string(f'Object processing time:\t {hm.precisedelta(dt.datetime.now() - iter_start)}')
-            counter += 1
-
-        # List 'directories'
-        ################################################################################################################
-        elif a in directories:
-            obj_dtype = 'directory'
-            print_string('{:4}{:<24}{:<60}'.format('', 'Object data type:', obj_dtype.upper()))
-
-            # If rar file in dir, scrub unpacked file
-            process_dir_dict = has_rar(obj_full_path)
-
-            if not process_dir_dict['continue']:
-                print_string('{:4}{:<24}{:<60}'.format('', 'Scrubbing result:', f"{process_dir_dict['response']}"))
-                print_string(f'Object processing time:\t {hm.precisedelta(dt.datetime.now() - iter_start)}')
-                failed_items_list.append([obj_dtype, a])
-                counter += 1
-                continue
-
-            if process_dir_dict['has_rar']:
-                print_string('{:4}{:<24}{:<60}'.format('', 'Scrubbing result:', f"{process_dir_dict['result'].upper()}"))
-
-            print_string('{:4}{:<24}{:<60}'.format('', 'Next stage:', 'Check if object exists in archive'))
-
-            process_result = instance_check(paths_dict, obj_full_path)
-            if process_result == 'failed':
-                failed_items_list.append([obj_dtype, a])
-
-            print_string(f'Object processing time:\t {hm.precisedelta(dt.datetime.now() - iter_start)}')
-            counter += 1
+    failed_items_list = run_cycle(paths_dict, itertools.chain([first_item], action_items), args)
+    memory_checkpoint('after processing')
+    print_string('{:<26}  {:<60}'.format('Filesystem objects:', sum(listed_counts.values())))
+    if backoff_skipped:
+        print_string('{:<26}  {:<60}'.format('Skipped, backing off:', len(backoff_skipped)))
     stage_num += 1
 
     ####################################################################################################################
     # This is the end
     print(f'{MARKER_CHAR * 140}')
     if failed_items_list:
-        print_string('')
-        print_string('Failed to archive these objects:')
-        for f in failed_items_list:
-            print_string('{:4}{:>10}:{:4}{:<60}'.format('', f'{f[0].title()}', '', f'{f[1]}'))
-        print_string('')
+        print_failed_items(failed_items_list)
+        print(f'{MARKER_CHAR * 140}')
+    if DEFERRED_ITEMS:
+        print_deferred_items()
         print(f'{MARKER_CHAR * 140}')
+    if SIZE_CACHE_STATS['hits'] or SIZE_CACHE_STATS['misses']:
+        print_size_cache_stats()
+    print_stage_summary()
+    finish_profiling()
+    release_run_lock()
     print_string(f'Execution completed. Total runtime:\t {hm.precisedelta(dt.datetime.now() - START_TIME)}')
     print(f'{MARKER_CHAR * 140}')
     print(f'{MARKER_CHAR * 140}\n')
@@ -632,5 +3771,6 @@ def main():
 
 
 ########################################################################################################################
+mark_startup('Module import')
 if __name__ == "__main__":
-    main()
+    main(parse_args())
@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+
+@pytest.mark.parametrize('plain, grouped', [
+    ('Movie.Name.2019.720p', 'Movie.Name.2019.720p-GRP'),
+    ('Show.S01E02.HDTV', 'Show.S01E02.HDTV-LOL'),
+    ('Show.S01.1080p.WEB-DL', 'Show.S01.1080p.WEB-DL-GRP'),
+    ('Some.Release.2024', 'Some Release 2024 [GRP]'),
+])
+def test_release_group_is_ignored_on_directories(plain, grouped):
+    assert main.normalize_name(plain) == main.normalize_name(grouped)
+
+
+def test_dotted_tags_are_kept_on_directories():
+    assert main.normalize_name('Movie.Name.2019.720p') == 'movie name 2019 720p'
+
+
+def test_hyphenated_tags_are_not_release_groups():
+    assert main.normalize_name('Show.S01.1080p.WEB-DL') == 'show s01 1080p web dl'
+
+
+@pytest.mark.parametrize('name, expected', [
+    ('Movie.Name.2019.720p-GRP.mkv', 'movie name 2019 720p'),
+    ('Movie.Name.2019.720p.mkv', 'movie name 2019 720p'),
+    ('Album.Name.2020.FLAC', 'album name 2020'),
+    ('Movie.Name.2019.720p', 'movie name 2019 720p'),
+])
+def test_only_known_extensions_are_stripped_from_files(name, expected):
+    assert main.normalize_name(name, is_file=True) == expected
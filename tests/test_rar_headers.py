@@ -0,0 +1,57 @@
+import os
+import sys
+import zlib
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import main
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'rar')
+
+
+def fixture_entries(name):
+    return {e['name']: e for e in main.list_rar_entries(os.path.join(FIXTURES, name))}
+
+
+@pytest.mark.parametrize('name, data', [
+    ('rar4_single', b'single volume rar4\n'),
+    ('rar5_single', b'single volume rar5\n'),
+])
+def test_single_volume(name, data):
+    entry = fixture_entries(name)['sample.txt']
+    assert entry['size'] == len(data)
+    assert entry['crc'] == zlib.crc32(data)
+    assert not entry['split_before'] and not entry['split_after']
+
+
+def test_rar4_path_separators():
+    assert set(fixture_entries('rar4_single')) == {'sample.txt', 'Extras/notes.txt'}
+
+
+@pytest.mark.parametrize('name, volumes, data', [
+    ('rar4_multi', ['sample.part01.rar', 'sample.part02.rar', 'sample.part03.rar'], bytes(range(256)) * 3),
+    ('rar4_old_naming', ['sample.rar', 'sample.r00', 'sample.r01'], bytes(range(256)) * 2),
+    ('rar5_multi', ['sample.part01.rar', 'sample.part02.rar'], bytes(range(256)) * 3),
+])
+def test_multi_volume(name, volumes, data):
+    volume_sets = main.find_rar_volume_sets(os.path.join(FIXTURES, name))
+    assert volume_sets == [[os.path.join(FIXTURES, name, v) for v in volumes]]
+
+    entries = fixture_entries(name)
+    assert list(entries) == ['sample.bin']
+    # The size comes from the first part and the CRC of the whole file from the last one
+    assert entries['sample.bin']['size'] == len(data)
+    assert entries['sample.bin']['crc'] == zlib.crc32(data)
+    assert not entries['sample.bin']['split_after']
+
+
+@pytest.mark.parametrize('name', ['rar4_unicode', 'rar5_unicode'])
+def test_unicode_names(name):
+    assert set(fixture_entries(name)) == {'Séries/Épisode 01.txt', '映画 🎬.txt'}
+
+
+def test_rar4_unicode_name_surrogate_pair():
+    # Plain name, NUL, high byte 0, then one flag byte selecting two full 16-bit code units (mode 2)
+    name_bytes = b'__\0' + bytes([0x00, 0xa0, 0x3c, 0xd8, 0xac, 0xdf])
+    assert main._decode_rar4_name(name_bytes, True) == '🎬'